@@ -7,10 +7,15 @@ Yet another 'Mine Sweeper' clone. Minimalistic, clean, easy to modify.
 - minimal UI, configuration is done via command line arguments
 - any grid size and mine density possible
 - 'auto reveal' mode automatically opens neighbors when cell has enough mines
+- 'no guess' mode moves the mines after the first click so that the field can
+  be solved without guessing, and hints are logical moves, see minesweeper_solver
+- press 'p' to show the probability of a mine in each closed cell as a heatmap
 """
 
 import tkinter
 import random
+import collections
+import minesweeper_solver
 
 BOOM, FLAG, CLOSED, CLEAR = -3, -2, -1, 0
 
@@ -32,6 +37,27 @@ class MineField:
 		self.marks = [[CLOSED for _ in range(height)] for _ in range(width)]
 		self.mines = [[random.random() < density for _ in range(height)] 
 		                                         for _ in range(width)]
+		self.init_counts()
+
+	def init_counts(self):
+		"""Precompute number of neighbor mines for each cell, and initialize
+		number of neighbor flags, both in flat arrays indexed by x*height+y.
+		Mines have to be set before; call again if they are changed.
+		"""
+		h = self.height
+		# number of mines in each cell and its upper and lower neighbor...
+		cols = [[0] * (h + 2)] * 2
+		for col in self.mines:
+			padded = [False] + col + [False]
+			cols.insert(-1, [a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])])
+		# ...plus same for left and right neighbor column, minus the cell itself
+		self.counts = bytearray(self.width * h)
+		for x, col in enumerate(self.mines):
+			left, mid, right = cols[x], cols[x+1], cols[x+2]
+			self.counts[x*h:(x+1)*h] = bytes(a + b + c - m for a, b, c, m in zip(left, mid, right, col))
+		self.flags = bytearray(self.width * h)
+		self.num_mines = sum(map(sum, self.mines))
+		self.num_flags = 0
 				
 	def print_mines(self):
 		"""Print a matrix to the console, showing the positions of the mines."""
@@ -50,47 +76,83 @@ class MineField:
 			print("")
 
 	def reveal(self, x, y, autoreveal=True):
-		"""Reveal the cell at the given coordinate. Return True, if it did not
-		hit a mine. If autoreveal is set, the autoreveal method is called.
+		"""Reveal the cell at the given coordinate. If autoreveal is set, the
+		autoreveal method is called. Return set of cells that changed; if any
+		of them is marked BOOM, a mine was hit.
 		"""
-		if self.marks[x][y] == CLOSED:
-			if self.mines[x][y] == True:
-				self.marks[x][y] = BOOM
-				return False
-			else:
-				n = self.count_neighbor_mines(x, y)
-				self.marks[x][y] = n
-				if autoreveal or n == 0:
-					self.auto_reveal(x, y)
-		return True
+		return self.flood([(x, y, autoreveal)])
 		
 	def auto_reveal(self, x, y):
 		"""If the cell has sufficient flag markers, all neighboring cells are
-		revealed (recursively).
+		revealed (recursively). Return set of cells that changed.
 		"""
-		n = self.count_neighbor_flags(x, y)
-		if self.marks[x][y] == n:
-			for (x2, y2) in self.get_valid_neighbors(x, y):
-				self.reveal(x2, y2, True)
+		if self.marks[x][y] == self.count_neighbor_flags(x, y):
+			return self.flood([(n, m, True) for (n, m) in self.get_valid_neighbors(x, y)])
+		return set()
+
+	def flood(self, cells):
+		"""Reveal cells, given as (x, y, autoreveal), and continue with the
+		neighbors of revealed cells with no neighbor mines, or all revealed
+		cells if autoreveal is set, if they have sufficient flag markers. This
+		uses a queue instead of recursion, so that the size of the revealed
+		area is not limited by the stack, and adds each cell only once. Return
+		set of cells that changed.
+		"""
+		marks, mines, counts, flags = self.marks, self.mines, self.counts, self.flags
+		w, h = self.width, self.height
+		changed = set()
+		seen = set(x*h+y for (x, y, _) in cells)
+		queue = collections.deque(cells)
+		while queue:
+			x, y, autoreveal = queue.popleft()
+			if marks[x][y] != CLOSED:
+				continue
+			changed.add((x, y))
+			if mines[x][y]:
+				marks[x][y] = BOOM
+				continue
+			n = marks[x][y] = counts[x*h+y]
+			if (autoreveal or n == 0) and n == flags[x*h+y]:
+				# same as get_valid_neighbors, but faster
+				for x2 in range(max(x-1, 0), min(x+2, w)):
+					col = marks[x2]
+					for y2 in range(max(y-1, 0), min(y+2, h)):
+						if col[y2] == CLOSED and x2*h+y2 not in seen:
+							seen.add(x2*h+y2)
+							queue.append((x2, y2, True))
+		return changed
 		
 	def mark(self, x, y, autoreveal=True):
 		"""Mark / unmark the given cell; call autoreveal to neighboring cells.
+		Return set of cells that changed.
 		"""
+		changed = set()
 		if self.marks[x][y] == CLOSED:
 			self.marks[x][y] = FLAG
+			self.update_flags(x, y, +1)
+			changed.add((x, y))
 			if autoreveal:
 				for (x2, y2) in self.get_valid_neighbors(x, y):
-					self.auto_reveal(x2, y2)
+					changed |= self.auto_reveal(x2, y2)
 		elif self.marks[x][y] == FLAG:
 			self.marks[x][y] = CLOSED
+			self.update_flags(x, y, -1)
+			changed.add((x, y))
+		return changed
+
+	def update_flags(self, x, y, delta):
+		"""Update number of flags and neighbor flags of neighbor cells."""
+		self.num_flags += delta
+		for (n, m) in self.get_valid_neighbors(x, y):
+			self.flags[n * self.height + m] += delta
 		
 	def count_neighbor_mines(self, x, y):
 		"""Count neighbor cells with a mine in it."""
-		return sum(self.mines[n][m] for (n, m) in self.get_valid_neighbors(x, y))
+		return self.counts[x * self.height + y]
 
 	def count_neighbor_flags(self, x, y):
 		"""Count neighbor cells with a flag on it."""
-		return sum(self.marks[n][m] == FLAG for (n, m) in self.get_valid_neighbors(x, y))
+		return self.flags[x * self.height + y]
 
 	def get_valid_neighbors(self, x, y):
 		"""Get valid neighbor cells for given cell."""
@@ -106,10 +168,7 @@ class MineField:
 
 	def remaining(self):
 		"""Get number of remaining mines."""
-		mines = sum(1 for _ in self.get_mines())
-		marked = sum(1 for x in range(self.width)
-					   for y in range(self.height) if self.marks[x][y] == FLAG)
-		return mines - marked
+		return self.num_mines - self.num_flags
 
 
 class MineFrame(tkinter.Frame):
@@ -120,7 +179,7 @@ class MineFrame(tkinter.Frame):
 	no mine counter, no timer, no highscores. Just you and the mines...
 	"""
 
-	def __init__(self, density=0.25, width=10, height=10, side= 20, autoreveal=False):
+	def __init__(self, density=0.25, width=10, height=10, side= 20, autoreveal=False, noguess=False):
 		"""Create Application Frame. The parameters are passed right through to
 		the Mine game object.
 		"""
@@ -130,8 +189,17 @@ class MineFrame(tkinter.Frame):
 		self.width, self.height, self.side = width, height, side
 		self.density = density
 		self.auto = autoreveal
+		self.noguess = noguess
 		self.game = None
+		self.solver = None
+		self.fresh = True
+		self.heatmap = False
+		self.items = {}
+		self.colors = {}
+		self.heat_cells = set()
+		self.rest_color = "gray"
 		self.bind_all("q", lambda a: self.quit())
+		self.bind_all("p", self.toggle_heatmap)
 		# create button
 		tkinter.Button(self, text="NEW", relief="groove", command=self.new_game).grid(row=0, column=0)
 		tkinter.Button(self, text="HINT", relief="groove", command=self.hint).grid(row=0, column=2)
@@ -146,67 +214,149 @@ class MineFrame(tkinter.Frame):
 	def new_game(self):
 		"""Start new game."""
 		self.game = MineField(self.width, self.height, self.density)
+		self.solver = minesweeper_solver.Solver(self.width, self.height, self.game.num_mines)
+		self.fresh = True
 		self.draw_field()
 
 	def hint(self):
-		"""Provide a hint by revealing a random zero-neighbor-cell."""
+		"""Provide a hint by revealing a cell or flagging a mine that can be
+		deduced from the revealed numbers, or if there is none, by revealing
+		a random zero-neighbor-cell.
+		"""
 		if not self.game:
 			return
-		zeros = [(x,y) for x in range(self.width) for y in range(self.height)
-		               if self.game.marks[x][y] == CLOSED and
-		                  not self.game.mines[x][y] and
-		                  self.game.count_neighbor_mines(x, y) == 0]
+		marks, h = self.game.marks, self.height
+		while not self.fresh:
+			for i in self.solver.safe:
+				if marks[i // h][i % h] == CLOSED:
+					return self.open_cell(i // h, i % h, True)
+			for i in self.solver.mines:
+				if marks[i // h][i % h] == CLOSED:
+					return self.update_cells(self.game.mark(i // h, i % h, self.auto))
+			if not any(self.solver.deduce()):
+				break
+		counts = self.game.counts
+		zeros = [(x,y) for x, (marks, mines) in enumerate(zip(self.game.marks, self.game.mines))
+		               for y in range(h)
+		               if counts[x*h+y] == 0 and marks[y] == CLOSED and not mines[y]]
 		if zeros:
 			x, y = random.choice(zeros)
-			self.game.reveal(x, y, True)
-			self.draw_field()
+			self.open_cell(x, y, True)
 
 	def reveal_cell(self, event):
 		"""Reveal cell where the mouse has been clicked."""
 		if self.game and (event.num == 1 or event.num == 3):
-			try:			
-				x, y = event.x // self.side, event.y // self.side
+			x, y = event.x // self.side, event.y // self.side
+			if 0 <= x < self.game.width and 0 <= y < self.game.height:
 				if event.num == 1:
-					self.game.reveal(x, y, self.auto)
+					self.open_cell(x, y, self.auto)
 				elif event.num == 3:
-					self.game.mark(x, y, self.auto)
-				self.draw_field()
-			except IndexError:
-				pass
+					self.update_cells(self.game.mark(x, y, self.auto))
+
+	def toggle_heatmap(self, event=None):
+		"""Show or hide the heatmap of mine probabilities."""
+		self.heatmap = not self.heatmap
+		if self.game:
+			self.update_heatmap()
+
+	def open_cell(self, x, y, autoreveal):
+		"""Reveal the given cell. In 'no guess' mode, the mines are first moved
+		so that the field can be solved from the first revealed cell.
+		"""
+		if self.fresh and self.noguess:
+			minesweeper_solver.make_solvable(self.game, x, y)
+			self.solver = minesweeper_solver.Solver(self.width, self.height, self.game.num_mines)
+		self.fresh = False
+		self.update_cells(self.game.reveal(x, y, autoreveal))
 	
 	def draw_field(self):
 		"""Draw the entire mine field. First, the canvas is cleared, then one by
-		one the marks for the individual cells are drawn. If there is a BOOM
-		marker, the game is set to gameover and the remaining mines are drawn.
+		one the marks for the individual cells are drawn.
+		"""
+		self.canvas.delete("all")
+		self.items = {}
+		self.colors = {}
+		self.heat_cells = set()
+		self.rest_color = "gray"
+		self.update_cells((col, line) for col in range(self.game.width)
+		                              for line in range(self.game.height))
+
+	def update_cells(self, cells):
+		"""Re-draw only the given cells, e.g. those changed by the last reveal
+		or mark, and update the mine counter. If there is a BOOM marker, the
+		game is set to gameover and the remaining mines are drawn.
+		"""
+		gameover = False
+		for (col, line) in cells:
+			self.draw_cell(col, line)
+			mark = self.game.marks[col][line]
+			gameover |= mark == BOOM
+			if mark >= 0:
+				self.solver.add_number(col * self.height + line, mark)
+		self.label["text"] = "%d mines left" % self.game.remaining()
+		if gameover:
+			# draw all mines
+			s2, s4 = self.side // 2, self.side // 4
+			for (col, line) in self.game.get_mines():
+				x, y = self.side * col, self.side * line
+				self.canvas.create_oval(x+s4, y+s4, x+s2+s4, y+s2+s4, fill="black")
+			self.game = None
+			self.label["text"] = "Game Over!"
+		elif self.heatmap:
+			self.update_heatmap()
+
+	def update_heatmap(self):
+		"""Color the closed cells by the probability of a mine if the heatmap is
+		shown, or gray otherwise, and re-draw only those cells whose color
+		changed. The probabilities are calculated by the solver, which only
+		enumerates the parts of the frontier changed since the last time.
+		Only cells with a probability of their own, now or the last time, are
+		checked; all the other closed cells share one color, and are only
+		checked if that color changed.
+		"""
+		probs, rest = self.solver.probabilities() if self.heatmap else ({}, None)
+		h = self.height
+		heat_cells = {(i // h, i % h) for i in probs}
+		cells = heat_cells | self.heat_cells
+		rest_color = "gray" if rest is None else heat_color(rest)
+		if rest_color != self.rest_color:
+			cells = ((col, line) for col in range(self.width) for line in range(h))
+		self.heat_cells, self.rest_color = heat_cells, rest_color
+		for col, line in cells:
+			if self.game.marks[col][line] == CLOSED:
+				p = probs.get(col * h + line, rest)
+				color = "gray" if p is None else heat_color(p)
+				if self.colors.get((col, line), "gray") != color:
+					self.colors[col, line] = color
+					self.draw_cell(col, line)
+
+	def draw_cell(self, col, line):
+		"""Replace the canvas item of a single cell according to its mark;
+		there is at most one item per cell, and none for cleared cells.
 		"""
-		coords = lambda col, line: (self.side * col, self.side * line)
 		s, s2, s4 = (self.side // x for x in (1, 2, 4))
-		if self.game:
-			self.canvas.delete("all")
-			gameover = False
-			for line in range(self.game.height):
-				for col in range(self.game.width):
-					x, y = coords(col, line)
-					mark = self.game.marks[col][line]
-					if mark == CLEAR:
-						continue
-					elif mark == CLOSED:
-						self.canvas.create_rectangle(x, y, x+s, y+s, fill="gray")
-					elif mark == FLAG:
-						self.canvas.create_oval(x+s4, y+s4, x+s2+s4, y+s2+s4, fill="blue")
-					elif mark == BOOM:
-						self.canvas.create_rectangle(x, y, x+s, y+s, fill="red")
-						gameover = True
-					else:
-						self.canvas.create_text(x+s2, y+s2, text=str(mark))
-				self.label["text"] = "%d mines left" % self.game.remaining()
-			if gameover:
-				# draw all mines
-				for (col, line) in self.game.get_mines():
-					x, y = coords(col, line)
-					self.canvas.create_oval(x+s4, y+s4, x+s2+s4, y+s2+s4, fill="black")
-				self.game = None
-				self.label["text"] = "Game Over!"
+		x, y = self.side * col, self.side * line
+		item = self.items.pop((col, line), None)
+		if item is not None:
+			self.canvas.delete(item)
+		mark = self.game.marks[col][line]
+		if mark == CLEAR:
+			return
+		elif mark == CLOSED:
+			item = self.canvas.create_rectangle(x, y, x+s, y+s, fill=self.colors.get((col, line), "gray"))
+		elif mark == FLAG:
+			item = self.canvas.create_oval(x+s4, y+s4, x+s2+s4, y+s2+s4, fill="blue")
+		elif mark == BOOM:
+			item = self.canvas.create_rectangle(x, y, x+s, y+s, fill="red")
+		else:
+			item = self.canvas.create_text(x+s2, y+s2, text=str(mark))
+		self.items[col, line] = item
+
+
+def heat_color(p):
+	"""Get color for probability of a mine, from green to red, in 20 steps."""
+	p = round(p * 20) / 20
+	return "#%02x%02x40" % (int(255 * p), int(255 * (1 - p)))
 
 
 # start application
@@ -214,11 +364,13 @@ if __name__ == "__main__":
 	density = .25
 	s_def = 15
 	s_min = 5
-	s_max = 50
+	s_max = 5000
 	import optparse
 	parser = optparse.OptionParser(("minesweeper.py [Options] [Density=%3f] "
 			+ "[Width=%d [Height=%d]]") % (density, s_def, s_def))
 	parser.add_option("-a", "--auto", dest="auto", help="auto reveal", action="store_true")
+	parser.add_option("-g", "--no-guess", dest="noguess", help="no guessing needed", action="store_true")
+	parser.add_option("-s", "--side", dest="side", type="int", default=20, help="size of cells in pixels")
 	(options, args) = parser.parse_args()
 
 	try:
@@ -230,5 +382,5 @@ if __name__ == "__main__":
 	except ValueError:
 		parser.error("Size must be a number between %d and %d" % (s_min, s_max))
 	else:
-		app = MineFrame(density, width, height, 20, options.auto)
+		app = MineFrame(density, width, height, options.side, options.auto, options.noguess)
 		app.mainloop()
@@ -0,0 +1,444 @@
+"""Minesweeper Solver
+
+Logical solver for the Minesweeper game, deducing safe cells and mines from the
+revealed numbers, without guessing. Used for hints and for moving the mines of
+a new mine field so that it can be solved without guessing.
+- each revealed number is a constraint: how many of its unknown neighbor cells
+  are mines; constraints are updated incrementally when cells become known
+- constraints are propagated: if none or all of their cells are mines, and for
+  pairs of overlapping constraints (subset and superset reasoning)
+- if that gets stuck, all configurations of mines are enumerated for each
+  independent component of the frontier (up to a bound), finding cells that
+  are mines in all or in none of them; only components that changed since the
+  last enumeration are enumerated again
+- the exact probability of a mine in each unknown cell is calculated from the
+  configurations of all components, weighted by the number of ways to place
+  the remaining mines in the other unknown cells; the configurations of each
+  component are cached, so only components that changed are enumerated again
+Cells are given by their index x*height+y, same as in MineField.
+"""
+
+import collections
+import itertools
+import math
+import random
+
+UNKNOWN, SAFE, MINE = 0, 1, 2
+
+MAX_CELLS = 64       # max. number of cells in frontier component to enumerate
+MAX_NODES = 100000   # max. number of search nodes for enumerating one component
+MOVE_TRIES = 20      # random cells to try when moving a mine away from the frontier
+
+
+class Solver:
+	"""Incremental Minesweeper Solver.
+
+	Revealed numbers are added with add_number, and deduce derives new safe
+	cells and mines from them. Deduced cells are kept in the sets safe (only
+	those not revealed yet) and mines.
+	"""
+
+	def __init__(self, width, height, total=None):
+		"""Create Solver for a mine field of the given size. If the total number
+		of mines is given, it is used when all the unknown cells left are safe
+		or are mines.
+		"""
+		self.width = width
+		self.height = height
+		self.total = total
+		self.state = bytearray(width * height)
+		self.unknown = width * height
+		self.numbers = {}
+		# number cell -> [unknown neighbors, number of mines among them]
+		self.constraints = {}
+		# unknown cell -> number cells with constraints on that cell
+		self.watch = collections.defaultdict(set)
+		self.dirty = set()
+		self.touched = set()
+		self.safe = set()
+		self.mines = set()
+		self.found = ([], [])
+		self.cache = {}
+
+	def neighbors(self, i):
+		"""Get valid neighbor cells for given cell."""
+		h = self.height
+		x, y = divmod(i, h)
+		return [x2*h+y2 for x2 in range(max(x-1, 0), min(x+2, self.width))
+		                for y2 in range(max(y-1, 0), min(y+2, h)) if x2 != x or y2 != y]
+
+	def add_number(self, i, n):
+		"""Add revealed cell with given number of neighbor mines."""
+		if i in self.numbers:
+			return
+		self.numbers[i] = n
+		self.safe.discard(i)
+		if self.state[i] == UNKNOWN:
+			self.settle(i, SAFE)
+		cells = set()
+		for j in self.neighbors(i):
+			if self.state[j] == UNKNOWN:
+				cells.add(j)
+			elif self.state[j] == MINE:
+				n -= 1
+		if cells:
+			self.constraints[i] = [cells, n]
+			for j in cells:
+				self.watch[j].add(i)
+			self.dirty.add(i)
+			self.touched.add(i)
+
+	def adjust(self, c, delta):
+		"""Change number of mines in constraint, e.g. if mines are moved."""
+		self.numbers[c] += delta
+		self.constraints[c][1] += delta
+		self.dirty.add(c)
+		self.touched.add(c)
+
+	def settle(self, i, value):
+		"""Set state of unknown cell and remove it from all constraints."""
+		self.state[i] = value
+		self.unknown -= 1
+		for c in self.watch.pop(i, ()):
+			constraint = self.constraints[c]
+			constraint[0].discard(i)
+			if value == MINE:
+				constraint[1] -= 1
+			if constraint[0]:
+				self.dirty.add(c)
+				self.touched.add(c)
+			else:
+				del self.constraints[c]
+
+	def decide(self, cells, mine):
+		"""Mark unknown cells as deduced mines or safe cells. Return whether
+		any cells were decided.
+		"""
+		cells = [i for i in cells if self.state[i] == UNKNOWN]
+		for i in cells:
+			self.settle(i, MINE if mine else SAFE)
+			(self.mines if mine else self.safe).add(i)
+			self.found[mine].append(i)
+		return bool(cells)
+
+	def deduce(self):
+		"""Deduce safe cells and mines, first by propagating constraints, and if
+		that gets stuck by enumerating the frontier and by the total number of
+		mines. Return lists of newly deduced safe cells and mines; both are
+		empty if nothing can be deduced without revealing more cells.
+		"""
+		self.propagate()
+		if not any(self.found):
+			self.enumerate()
+		if not any(self.found):
+			self.count_mines()
+		found, self.found = self.found, ([], [])
+		return found
+
+	def propagate(self):
+		"""Check changed constraints until nothing more can be deduced: if none
+		or all of their cells are mines, or, for each overlapping constraint,
+		if all the cells only in one of them must be mines, then all the cells
+		only in the other one are safe.
+		"""
+		constraints, watch, dirty = self.constraints, self.watch, self.dirty
+		while dirty:
+			c = dirty.pop()
+			if c not in constraints:
+				continue
+			cells, n = constraints[c]
+			if n == 0 or n == len(cells):
+				self.decide(list(cells), n > 0)
+				continue
+			for d in set(d for j in cells for d in watch[j]):
+				if d == c:
+					continue
+				cells2, n2 = constraints[d]
+				only1, only2 = cells - cells2, cells2 - cells
+				if n - n2 == len(only1):
+					decided = self.decide(only1, True) | self.decide(only2, False)
+				elif n2 - n == len(only2):
+					decided = self.decide(only2, True) | self.decide(only1, False)
+				else:
+					continue
+				if decided:
+					dirty.add(c)
+					break
+
+	def enumerate(self):
+		"""Enumerate configurations of each frontier component that changed
+		since the last enumeration, and decide cells that are mines in all or
+		in none of them.
+		"""
+		touched, self.touched = self.touched, set()
+		seen = set()
+		for c in touched:
+			if c in seen or c not in self.constraints:
+				continue
+			component, cells = self.component(c)
+			seen |= component
+			configs = self.configurations(component, cells)
+			if configs:
+				total = sum(num for num, _ in configs.values())
+				mines = [sum(counts) for counts in zip(*(counts for _, counts in configs.values()))]
+				self.decide([j for j, m in zip(cells, mines) if m == 0], False)
+				self.decide([j for j, m in zip(cells, mines) if m == total], True)
+
+	def component(self, c):
+		"""Get connected component of the frontier containing the constraint,
+		i.e. all constraints connected by sharing cells, and the list of their
+		cells, in breadth-first order.
+		"""
+		component, cells, seen = {c}, [], set()
+		queue = collections.deque([c])
+		while queue:
+			d = queue.popleft()
+			for j in self.constraints[d][0]:
+				if j not in seen:
+					seen.add(j)
+					cells.append(j)
+					for e in self.watch[j]:
+						if e not in component:
+							component.add(e)
+							queue.append(e)
+		return component, cells
+
+	def configurations(self, component, cells):
+		"""Count configurations of mines in the cells satisfying all constraints
+		of the component, by backtracking. Return dictionary mapping number of
+		mines to number of configurations and, for each cell, the number of
+		those with a mine in that cell; or None if there are too many cells or
+		search nodes.
+		"""
+		if len(cells) > MAX_CELLS:
+			return None
+		index = {j: k for k, j in enumerate(cells)}
+		need, left = [], []
+		of_cell = [[] for _ in cells]
+		for c in component:
+			cs, n = self.constraints[c]
+			for j in cs:
+				of_cell[index[j]].append(len(need))
+			need.append(n)
+			left.append(len(cs))
+		assign = [0] * len(cells)
+		configs = {}
+		nodes = 0
+
+		def search(k, m):
+			nonlocal nodes
+			nodes += 1
+			if nodes > MAX_NODES:
+				return
+			if k == len(cells):
+				config = configs.setdefault(m, [0, [0] * len(cells)])
+				config[0] += 1
+				counts = config[1]
+				for j, a in enumerate(assign):
+					counts[j] += a
+				return
+			cs = of_cell[k]
+			for a in (0, 1):
+				for c in cs:
+					need[c] -= a
+					left[c] -= 1
+				if all(0 <= need[c] <= left[c] for c in cs):
+					assign[k] = a
+					search(k + 1, m + a)
+				for c in cs:
+					need[c] += a
+					left[c] += 1
+			assign[k] = 0
+
+		search(0, 0)
+		return configs if nodes <= MAX_NODES else None
+
+	def count_mines(self):
+		"""If the total number of mines is known, and either no mines or only
+		mines are left in the unknown cells, decide all of them.
+		"""
+		if self.total is None or not self.unknown:
+			return
+		left = self.total - len(self.mines)
+		if left == 0 or left == self.unknown:
+			self.decide([i for i, s in enumerate(self.state) if s == UNKNOWN], left > 0)
+
+	def probabilities(self):
+		"""Get the probability of a mine in each unknown cell. Configurations of
+		the frontier components are combined, each combination weighted by the
+		number of ways to place the remaining mines in the other unknown cells,
+		if the total number of mines is known. Return dictionary of the
+		probabilities of the frontier cells and of all deduced cells not
+		revealed yet, and the probability for each other unknown cell (None if
+		the total number of mines is not known). Constraints are propagated
+		first, so that the frontier is as small as possible. Cells of
+		components that are too large to enumerate are counted as other cells,
+		so in that case the probabilities are only approximations.
+		"""
+		self.propagate()
+		cache, self.cache = self.cache, {}
+		components, seen = [], set()
+		for c in self.constraints:
+			if c in seen:
+				continue
+			component, cells = self.component(c)
+			seen |= component
+			key = frozenset((d, self.constraints[d][1], frozenset(self.constraints[d][0]))
+			                for d in component)
+			if key not in cache:
+				cache[key] = cells, self.configurations(component, cells)
+			self.cache[key] = cells, configs = cache[key]
+			if configs:
+				low = min(configs)
+				components.append((cells, low, [configs[m][0] if m in configs else 0
+				                                for m in range(low, max(configs) + 1)], configs))
+
+		# number of combinations for each total number of mines in the frontier
+		low = sum(c[1] for c in components)
+		total = [1]
+		for _, _, poly, _ in components:
+			total = multiply(total, poly)
+		# weights for number of mines in the frontier: ways to place the rest
+		others = self.unknown - sum(len(c[0]) for c in components)
+		left = None if self.total is None else self.total - len(self.mines) - low
+		weights = [1] * len(total) if left is None else binomials(others, left, len(total))
+		norm = sum(a * b for a, b in zip(total, weights))
+		if norm == 0:
+			# total number of mines does not fit, ignore it
+			left, weights, norm = None, [1] * len(total), sum(total)
+
+		probs = dict.fromkeys(self.safe, 0.)
+		probs.update(dict.fromkeys(self.mines, 1.))
+		for cells, low2, poly, configs in components:
+			# combinations of all the other components
+			rest = divide(total, poly)
+			sums = [0] * len(cells)
+			for m, (_, counts) in configs.items():
+				weight = sum(a * b for a, b in zip(rest, weights[m - low2:]))
+				for k, n in enumerate(counts):
+					sums[k] += n * weight
+			probs.update((j, n / norm) for j, n in zip(cells, sums))
+		if left is None or others == 0:
+			return probs, None
+		mines = sum(a * b * (left - t) for t, (a, b) in enumerate(zip(total, weights)))
+		return probs, mines / (others * norm)
+
+
+def multiply(a, b):
+	"""Multiply polynomials given as lists of coefficients."""
+	res = [0] * (len(a) + len(b) - 1)
+	for i, x in enumerate(a):
+		if x:
+			for j, y in enumerate(b):
+				res[i+j] += x * y
+	return res
+
+def divide(a, b):
+	"""Divide polynomials given as lists of coefficients, if the division has
+	no remainder, which is the case for the product of the other components;
+	b[0] must not be zero.
+	"""
+	res = []
+	for i in range(len(a) - len(b) + 1):
+		x = a[i] - sum(b[j] * res[i-j] for j in range(1, min(i, len(b) - 1) + 1))
+		res.append(x // b[0])
+	return res
+
+def binomials(n, k, count):
+	"""Get list of binomial coefficients (n over k-t) for t = 0, ..., count-1,
+	each calculated from the one before, if possible.
+	"""
+	res = []
+	for t in range(count):
+		k2 = k - t
+		if not 0 <= k2 <= n:
+			res.append(0)
+		elif res and res[-1]:
+			res.append(res[-1] * (k2 + 1) // (n - k2))
+		else:
+			res.append(math.comb(n, k2))
+	return res
+
+def probabilities(field):
+	"""Get probability of a mine in each cell of a MineField that is not
+	revealed, given the revealed numbers and the total number of mines; flags
+	are not taken into account. Return dictionary mapping (x, y) to the
+	probability.
+	"""
+	h = field.height
+	solver = Solver(field.width, h, field.num_mines)
+	for x, marks in enumerate(field.marks):
+		for y, mark in enumerate(marks):
+			if mark >= 0:
+				solver.add_number(x*h+y, mark)
+	probs, rest = solver.probabilities()
+	return {(x, y): probs.get(x*h+y, rest) for x, marks in enumerate(field.marks)
+	                                      for y, mark in enumerate(marks) if mark < 0}
+
+
+def make_solvable(field, x, y):
+	"""Move the mines of a new MineField so that it can be solved without
+	guessing, starting by revealing the given cell. The cell and its neighbors
+	are cleared first; then the field is solved, revealing all cells found to
+	be safe, and whenever the solver gets stuck, the mines in the cells of the
+	smallest constraint are moved to random cells not next to a revealed cell,
+	so that those cells are safe. Unknown cells left in the end are not next
+	to a revealed cell and are filled with mines. Thus the number of mines is
+	only kept approximately: it drops if no such cell is left for a mine, and
+	grows by the cells filled in the end, usually by a few mines either way.
+	Flags are kept, as they do not depend on the mines.
+	"""
+	h = field.height
+	mines, counts = field.mines, field.counts
+	solver = Solver(field.width, h)
+	state = solver.state
+
+	def set_mine(i, mine):
+		mines[i // h][i % h] = mine
+		for j in solver.neighbors(i):
+			counts[j] += 1 if mine else -1
+		for c in solver.watch.get(i, ()):
+			solver.adjust(c, 1 if mine else -1)
+
+	def move_mine(i, keep):
+		nonlocal no_room
+		set_mine(i, False)
+		size = len(state)
+		tries = [random.randrange(size) for _ in range(MOVE_TRIES)]
+		offset = random.randrange(size)
+		scan = () if no_room else ((offset + k) % size for k in range(size))
+		for j in itertools.chain(tries, scan):
+			if (state[j] == UNKNOWN and j not in keep and not mines[j // h][j % h]
+					and all(state[n] != SAFE for n in solver.neighbors(j))):
+				set_mine(j, True)
+				return
+		# cells only get revealed, so there will not be any such cell later
+		no_room = True
+
+	no_room = False
+	start = x*h+y
+	keep = set([start] + solver.neighbors(start))
+	for i in keep:
+		if mines[i // h][i % h]:
+			move_mine(i, keep)
+	solver.add_number(start, counts[start])
+	while True:
+		safe, found = solver.deduce()
+		for i in safe:
+			solver.add_number(i, counts[i])
+		if safe or found:
+			continue
+		if not solver.constraints:
+			break
+		c = min(solver.constraints, key=lambda c: len(solver.constraints[c][0]))
+		cells = set(solver.constraints[c][0])
+		for i in cells:
+			if mines[i // h][i % h]:
+				move_mine(i, cells)
+	for i, s in enumerate(state):
+		if s == UNKNOWN:
+			mines[i // h][i % h] = True
+	flags, num_flags = field.flags, field.num_flags
+	field.init_counts()
+	field.flags, field.num_flags = flags, num_flags
+	return field
@@ -2,70 +2,390 @@
 Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
 Simple AI for playing the slider game.
 
-TODO
-- valid moves takes most time (by far) --> make it faster
-- try some heuristic, e.g. minimum difference between adjacent cells
+Run as script for playing a batch of games in parallel and collecting some
+statistics, e.g. `python3 slider_ai.py -S expectimax -n 100 -o results.csv`.
 """
 
-import slider_model
+import slider_model, slider_cache
+from slider_model import LEFT, RIGHT, UP, DOWN, SKIP, BITS, CELL_MASK
 import time, random
 
+try:
+    import slider_batch
+except ImportError:
+    slider_batch = None
+
+# parameters for expectimax search; weights of the evaluation function have
+# been tuned by hand on a few dozen games
+TIMEOUT       = 0.1   # time per move in seconds
+MAX_DEPTH     = 6     # maximum search depth (number of own moves)
+PROB_CUTOFF   = 1e-3  # chance nodes less likely than this are not expanded
+EMPTY_WEIGHT  = 270.  # bonus for each empty cell
+MERGE_WEIGHT  = 700.  # bonus for each pair of equal adjacent cells
+SMOOTH_WEIGHT = 10.   # penalty for differences of adjacent cells, see adjacent_diff
+MONO_WEIGHT   = 47.   # penalty for rows and columns not being monotonic
+LOSS          = -1e5  # value of positions where the game is over
+
 def random_play(game):
-    """ Perform one random playout, chosing valid moves until game over; return
-    final score and first move. """
-    first = random.choice(game.valid_moves())
-    game.apply_move(first, False)
-    moves = [first]
-    valid = game.valid_moves()
-    while valid:
-        m = random.choice(valid)
-        game.apply_move(m, False)
-        moves.append(m)
+    """ Perform one random playout on the packed field of the game, chosing
+    valid moves until game over; return score of the playout and moves. The
+    game itself is not changed. If a value gets too large for packing, the
+    playout is done on a copy of the unpacked game instead. """
+    try:
+        return slider_model.random_play_packed(slider_model.pack(game.field), game.rules)
+    except OverflowError:
+        return random_play_unpacked(game)
+
+def random_play_unpacked(game):
+    """ Same as random_play, but on a copy of the game, for fields that can
+    not be packed; much slower. """
+    game = game.clone()
+    score, moves = game.score, []
+    while True:
         valid = game.valid_moves()
-    return game.score, moves
+        if not valid:
+            return game.score - score, moves
+        move = random.choice(valid)
+        game.apply_move(move, False)
+        moves.append(move)
 
 def best_move_random_plays(game, num_plays):
     """ Perform a certain number of random plays and then return the move that
     yielded the highest score over all those plays. """
     scores = {m: 0 for m in game.valid_moves()}
     for i in range(num_plays):
-        copy = slider_model.SliderGame()
-        copy.field = list(map(list, game.field))
-        score, moves = random_play(copy)
+        score, moves = random_play(game)
         scores[moves[0]] += score
     return max(scores, key=scores.get)
 
+def best_move_batch(game, num_plays):
+    """ Same as best_move_random_plays, but with a certain number of random
+    plays for each valid move, all played at once with the NumPy batch
+    simulator; return the move with the highest average score. """
+    moves = game.valid_moves()
+    batch = slider_batch.BatchGame(len(moves) * num_plays, game.rules, game.field, random.getrandbits(32))
+    batch.apply_moves([slider_batch.MOVE_LIST.index(m) for m in moves for _ in range(num_plays)])
+    scores = batch.random_play().reshape(len(moves), num_plays).sum(axis=1)
+    return moves[scores.argmax()]
+
+def line_diff(line):
+    """ Sum of differences (squared) of adjacent non-empty cells in a line. """
+    return sum(2**abs(a-b) for a,b in zip(line, line[1::]) if a and b)
+
 def adjacent_diff(game):
     """ Heuristic function, returning sum of differences (squared) of adjacent
     cells in the field. """
-    def h(line):
-        return sum(2**abs(a-b) for a,b in zip(line, line[1::]) if a and b)
-    return sum(map(h, game.field)) + sum(map(h, zip(*game.field)))
+    return sum(map(line_diff, game.field)) + sum(map(line_diff, zip(*game.field)))
 
-def best_move_heuristic(game, h):
-    """ Deterministically select best move using given heuristic function. """
+def best_move_heuristic(game, h, cache=None):
+    """ Deterministically select best move using given heuristic function,
+    optionally caching its values in a position cache. """
     heur = {}
     for move in game.valid_moves():
-        copy = slider_model.SliderGame()
-        copy.field = list(map(list, game.field))
-        copy.apply_move(move, False)
-        heur[move] = h(copy)
+        game.push()
+        game.apply_move(move, False)
+        if cache is None or not slider_model.fits_packed(game.field):
+            heur[move] = h(game)
+        else:
+            key = cache.key(slider_model.pack(game.field))
+            heur[move] = cache.get(key)
+            if heur[move] is None:
+                heur[move] = h(game)
+                cache.put(key, heur[move])
+        game.undo()
     return max(heur, key=heur.get)
 
+# position caches, by rules and name of the cached values, see get_cache
+CACHES = {}
+
+def get_cache(rules, name):
+    """ Get position cache for the given rules and values, e.g. "expectimax",
+    shared by all searches in this process. """
+    if (rules, name) not in CACHES:
+        CACHES[rules, name] = slider_cache.PositionCache(rules)
+    return CACHES[rules, name]
+
+
+# EXPECTIMAX SEARCH
+
+class SearchTimeout(Exception):
+    """ Raised when the time for a search is up. """
+
+# heuristic value for each row, by width of the field, filled on first use;
+# columns are evaluated as rows of the transposed field
+_HEURISTIC = {}
+
+def _row_heuristic(heuristic, width, row):
+    """ Calculate and add heuristic value of single packed row. """
+    cells = [(row >> (x * BITS)) & CELL_MASK for x in range(width)]
+    merges = sum(1 for a, b in zip(cells, cells[1:]) if a == b != 0)
+    inc = sum(2**b - 2**a for a, b in zip(cells, cells[1:]) if b > a)
+    dec = sum(2**a - 2**b for a, b in zip(cells, cells[1:]) if a > b)
+    value = (EMPTY_WEIGHT * cells.count(0) + MERGE_WEIGHT * merges
+             - SMOOTH_WEIGHT * line_diff(cells) - MONO_WEIGHT * min(inc, dec))
+    heuristic[row] = value
+    return value
+
+def evaluate(packed, rules=slider_model.DEFAULT):
+    """ Combined heuristic evaluation of packed field: number of empty cells,
+    possible merges, smoothness (see adjacent_diff) and monotonicity. """
+    t = rules.tables
+    heuristic = _HEURISTIC.setdefault(t.width, {})
+    value = 0.
+    for field in (packed, t.transpose(packed)):
+        for y in range(t.width):
+            row = (field >> (y * t.row_bits)) & t.row_mask
+            h = heuristic.get(row)
+            value += h if h is not None else _row_heuristic(heuristic, t.width, row)
+    return value
+
+class Expectimax:
+    """ Depth-limited expectimax search on packed fields. Max nodes are the
+    player's moves, chance nodes the spawning of new numbers on empty cells,
+    each weighted with its probability. Chance nodes whose probability falls
+    below PROB_CUTOFF are evaluated heuristically instead of being expanded.
+    Values of chance nodes are cached in a position cache, which can be
+    shared by all searches (and games) with the same rules, tagged with depth
+    and number of spawns (4 bits each); only values that do not depend on the
+    probability of the node, i.e. where no node below was cut off, are cached.
+    """
+
+    def __init__(self, deadline, rules=slider_model.DEFAULT, cache=None):
+        self.deadline = deadline
+        self.rules = rules
+        self.tables = rules.tables
+        self.spawns = rules.spawn_probabilities()
+        self.cache = slider_cache.PositionCache(rules) if cache is None else cache
+        self.nodes = 0
+        self.cutoffs = 0
+        if rules.create_turn > 15:
+            raise ValueError("too many spawns per turn for cache tag: %d" % rules.create_turn)
+
+    def moves(self, packed):
+        """ Get valid moves for packed field, with new field and score. """
+        for move in (LEFT, RIGHT, UP, DOWN):
+            new, score = self.tables.slide(packed, move)
+            if new != packed:
+                yield move, new, score
+        if self.rules.allow_noop and slider_model.count_empty(packed, self.rules) >= self.rules.create_turn:
+            yield SKIP, packed, 0
+
+    def max_node(self, packed, depth, prob):
+        """ Get value of best move on packed field. """
+        self.nodes += 1
+        if self.nodes % 100 == 0 and time.time() > self.deadline:
+            raise SearchTimeout()
+        if depth == 0:
+            return evaluate(packed, self.rules)
+        best = LOSS
+        for move, new, score in self.moves(packed):
+            best = max(best, score + self.chance_node(new, depth, prob, self.rules.create_turn))
+        return best
 
-random.seed(0)
-NUM_GAMES = 20
-MAX_TURNS = 1000
-game = slider_model.SliderGame()
-k = 0
-START = time.time()
-while k < MAX_TURNS and game.valid_moves():
-    k += 1
+    def chance_node(self, packed, depth, prob, spawns):
+        """ Get expected value of packed field after the given number of new
+        numbers have been spawned, before the next move. """
+        cells = slider_model.empty_cells_packed(packed, self.rules) if spawns else None
+        if not cells:
+            return self.max_node(packed, depth - 1, prob)
+        if prob < PROB_CUTOFF:
+            self.cutoffs += 1
+            return evaluate(packed, self.rules)
+        key = self.cache.key(packed, depth << 4 | spawns)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        cutoffs = self.cutoffs
+        value = 0.
+        p_cell = prob / len(cells)
+        for i in cells:
+            for n, p in self.spawns:
+                value += p * self.chance_node(packed | n << (i * BITS), depth, p_cell * p, spawns - 1)
+        value /= len(cells)
+        if self.cutoffs == cutoffs:
+            self.cache.put(key, value)
+        return value
+
+def best_move_expectimax(game, timeout=TIMEOUT, max_depth=MAX_DEPTH, cache=None):
+    """ Select best move using expectimax search with iterative deepening,
+    until the time is up or the maximum depth is reached. Values are cached
+    in the given position cache, or the one shared by all searches. As each
+    move increases the highest value by at most one, the depth is limited so
+    that all fields in the search can be packed; if not even one move fits,
+    the best move is selected heuristically on the unpacked field. """
+    if max_depth > 15:
+        raise ValueError("maximum depth too large for cache tag: %d" % max_depth)
+    moves = game.valid_moves()
+    if len(moves) <= 1:
+        return moves[0] if moves else None
+    max_depth = min(max_depth, slider_model.MAX_VALUE - max(map(max, game.field)))
+    if max_depth < 1:
+        return best_move_heuristic(game, adjacent_diff)
+    cache = get_cache(game.rules, "expectimax") if cache is None else cache
+    search = Expectimax(time.time() + timeout, game.rules, cache)
+    packed = slider_model.pack(game.field)
+    best = moves[0]
+    for depth in range(1, max_depth + 1):
+        try:
+            values = {move: score + search.chance_node(new, depth, 1., game.rules.create_turn)
+                      for move, new, score in search.moves(packed)}
+        except SearchTimeout:
+            break
+        best = max(values, key=values.get)
+    return best
+
+
+# BATCH SELF-PLAY
+
+NUM_GAMES = 20    # number of random plays per move
+BATCH_GAMES = 200 # number of random plays per valid move for batch strategy;
+                  # from about 100 on, NumPy is faster than pure Python plays
+MAX_TURNS = 1000  # maximum number of turns per game
+
+STRATEGIES = {
+    "random":     lambda game: best_move_random_plays(game, NUM_GAMES),
+    "heuristic":  lambda game: best_move_heuristic(game, adjacent_diff, get_cache(game.rules, "adjacent_diff")),
+    "expectimax": lambda game: best_move_expectimax(game, TIMEOUT),
+}
+if slider_batch:
+    STRATEGIES["batch"] = lambda game: best_move_batch(game, BATCH_GAMES)
+
+def init_worker(timeout, num_games, rules=slider_model.DEFAULT, cache_path=None, batch_games=BATCH_GAMES):
+    """ Initialize worker process with parameters of the AI, and optionally
+    load the expectimax cache from file, saving it again when the worker
+    exits. As the values depend on the evaluation function, the file should
+    be deleted after changing any of its weights. """
+    global TIMEOUT, NUM_GAMES, BATCH_GAMES
+    TIMEOUT, NUM_GAMES, BATCH_GAMES = timeout, num_games, batch_games
+    if cache_path:
+        import multiprocessing.util
+        cache = get_cache(rules, "expectimax")
+        cache.load(cache_path)
+        multiprocessing.util.Finalize(None, cache.save, args=(cache_path,), exitpriority=10)
+
+def play_game(strategy, seed, max_turns=MAX_TURNS, rules=slider_model.DEFAULT, log_dir=None):
+    """ Play one game with the given strategy and rules until game over or the
+    maximum number of turns, optionally recording it to a game log in the
+    given directory; return dict with results of the game. """
+    random.seed(seed)
+    game = slider_model.SliderGame(rules)
+    best_move = STRATEGIES[strategy]
+    cache_stats = [(c.hits, c.misses) for c in CACHES.values()]
+    log = None
+    if log_dir:
+        import os, slider_log
+        log = slider_log.LogWriter(os.path.join(log_dir, "game_%d.slog" % seed), game, seed)
     start = time.time()
-    move = best_move_random_plays(game, NUM_GAMES)
-    #~move = best_move_heuristic(game, adjacent_diff)
-    print(k, move, time.time() - start)
-    game.apply_move(move)
-    game.show()
-    
-print(game.score, time.time() - START)
+    while game.turn < max_turns and game.valid_moves():
+        move = best_move(game)
+        game.apply_move(move)
+        if log:
+            log.record(move)
+    duration = time.time() - start
+    if log:
+        log.close()
+    hits = sum(c.hits for c in CACHES.values()) - sum(h for h, _ in cache_stats)
+    misses = sum(c.misses for c in CACHES.values()) - sum(m for _, m in cache_stats)
+    return {"seed": seed, "score": game.score, "max_tile": 2**max(map(max, game.field)),
+            "turns": game.turn, "game_over": not game.valid_moves(),
+            "time": duration, "moves_per_sec": game.turn / max(duration, 1e-9),
+            "cache_hits": hits, "cache_misses": misses}
+
+def run_batch(strategy, games, workers=None, seed=None, max_turns=MAX_TURNS,
+              rules=slider_model.DEFAULT, timeout=TIMEOUT, num_games=NUM_GAMES, log_dir=None,
+              cache_path=None, batch_games=BATCH_GAMES):
+    """ Play a number of seeded games with the given rules in a process pool,
+    optionally recording them to game logs in the given directory, and using
+    a persistent expectimax cache; return list of results of the individual
+    games, ordered by game. """
+    import concurrent.futures
+    master = random.Random(seed)
+    seeds = [master.getrandbits(32) for _ in range(games)]
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+            initargs=(timeout, num_games, rules, cache_path, batch_games)) as pool:
+        return list(pool.map(play_game, [strategy] * games, seeds, [max_turns] * games,
+                             [rules] * games, [log_dir] * games))
+
+def percentile(values, p):
+    """ Get p-th percentile of values (nearest rank). """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def summarize(results):
+    """ Get summary statistics for list of game results: distributions of
+    score, max tile and turns survived, and overall moves per second. """
+    summary = {"games": len(results)}
+    for key in ("score", "turns"):
+        values = [r[key] for r in results]
+        summary[key] = {"mean": sum(values) / len(values), "min": min(values), "max": max(values),
+                        **{"p%d" % p: percentile(values, p) for p in (10, 25, 50, 75, 90)}}
+    tiles = {}
+    for r in results:
+        tiles[r["max_tile"]] = tiles.get(r["max_tile"], 0) + 1
+    summary["max_tile"] = dict(sorted(tiles.items()))
+    summary["game_over"] = sum(r["game_over"] for r in results)
+    summary["moves_per_sec"] = sum(r["turns"] for r in results) / max(sum(r["time"] for r in results), 1e-9)
+    summary["cache_hits"] = sum(r["cache_hits"] for r in results)
+    summary["cache_misses"] = sum(r["cache_misses"] for r in results)
+    return summary
+
+def report(summary):
+    """ Print summary in a somewhat readable way. """
+    print("%d games, %d game over" % (summary["games"], summary["game_over"]))
+    for key in ("score", "turns"):
+        print("%-6s" % key, " ".join("%s %.0f" % item for item in summary[key].items()))
+    print("max tile", " ".join("%d: %d" % item for item in summary["max_tile"].items()))
+    print("moves per second %.1f" % summary["moves_per_sec"])
+    hits, misses = summary["cache_hits"], summary["cache_misses"]
+    print("cache %d hits, %d misses, hit rate %.3f" % (hits, misses, hits / max(1, hits + misses)))
+
+def write_results(path, results, summary, info):
+    """ Write results to CSV file (one line per game) or JSON file (settings,
+    summary and games), depending on file extension. """
+    if path.endswith(".csv"):
+        import csv
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, list(info) + list(results[0]))
+            writer.writeheader()
+            for r in results:
+                writer.writerow({**info, **r})
+    else:
+        import json
+        with open(path, "w") as f:
+            json.dump({"settings": info, "summary": summary, "games": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    import optparse, os
+    parser = optparse.OptionParser("slider_ai.py [Options]")
+    parser.add_option("-S", "--strategy", dest="strategy", default="random",
+                      help="strategy, one of " + ", ".join(STRATEGIES))
+    parser.add_option("-n", "--games", dest="games", type="int", default=1, help="number of games")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=os.cpu_count(), help="worker processes")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=0, help="master random seed")
+    parser.add_option("-m", "--max-turns", dest="max_turns", type="int", default=MAX_TURNS, help="maximum turns per game")
+    parser.add_option("-t", "--timeout", dest="timeout", type="float", default=TIMEOUT, help="time per move (expectimax)")
+    parser.add_option("-p", "--plays", dest="plays", type="int", default=NUM_GAMES, help="random plays per move (random)")
+    parser.add_option("-b", "--batch-plays", dest="batch_plays", type="int", default=BATCH_GAMES,
+                      help="random plays per valid move (batch)")
+    parser.add_option("-o", "--output", dest="output", default=None, help="write results to .csv or .json file")
+    parser.add_option("-l", "--log-dir", dest="log_dir", default=None, help="record games to logs in directory")
+    parser.add_option("-c", "--cache", dest="cache", default=None, help="load and save expectimax cache file")
+    for name, value in slider_model.DEFAULT._asdict().items():
+        parser.add_option("--" + name.replace("_", "-"), dest=name, type=type(value).__name__,
+                          default=value, help="rules: %s (default %s)" % (name, value))
+    (options, args) = parser.parse_args()
+
+    if options.strategy not in STRATEGIES:
+        parser.error("Unknown strategy, use one of: " + ", ".join(STRATEGIES))
+    rules = slider_model.Rules(**{name: getattr(options, name) for name in slider_model.Rules._fields})
+    results = run_batch(options.strategy, options.games, options.workers, options.seed,
+                        options.max_turns, rules, options.timeout, options.plays, options.log_dir, options.cache,
+                        options.batch_plays)
+    summary = summarize(results)
+    report(summary)
+    if options.output:
+        info = {"strategy": options.strategy, "master_seed": options.seed, "max_turns": options.max_turns,
+                "timeout": options.timeout, "plays": options.plays,
+                "batch_plays": options.batch_plays, **rules._asdict()}
+        write_results(options.output, results, summary, info)
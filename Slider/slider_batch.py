@@ -0,0 +1,141 @@
+"""
+Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
+Batch simulator, playing many games at once using NumPy arrays.
+
+All boards of a batch are held in one array of shape (K, width, width), with
+the same values (as power of two) as in SliderGame.field. Moves are applied by
+sliding all rows of all boards to the left at once, after flipping and/or
+transposing the boards according to the move.
+"""
+
+import numpy as np
+import slider_model
+from slider_model import LEFT, RIGHT, UP, DOWN, SKIP
+
+# moves in the order used for arrays of valid moves and for move indices
+MOVE_LIST = [LEFT, RIGHT, UP, DOWN, SKIP]
+
+
+def _orient(boards, move):
+    """ Get view of boards so that the move is a move to the left. """
+    if move == RIGHT: return boards[:, :, ::-1]
+    if move == UP:    return boards.transpose(0, 2, 1)
+    if move == DOWN:  return boards.transpose(0, 2, 1)[:, :, ::-1]
+    return boards
+
+def slide_left(rows):
+    """ Slide array of rows (N, width) to the left, merging pairs of equal
+    cells same as SliderGame._compress; return new rows and score of each. """
+    n, width = rows.shape
+    # move non-empty cells to the front, keeping their order
+    order = np.argsort(rows == 0, axis=1, kind="stable")
+    rows = np.take_along_axis(rows, order, axis=1)
+    score = np.zeros(n, dtype=np.int64)
+    for i in range(width - 1):
+        merge = (rows[:, i] != 0) & (rows[:, i] == rows[:, i+1])
+        if merge.any():
+            rows[merge, i] += 1
+            score[merge] += 2 ** rows[merge, i].astype(np.int64)
+            rows[merge, i+1:-1] = rows[merge, i+2:]
+            rows[merge, -1] = 0
+    return rows, score
+
+def slide(boards, move):
+    """ Apply the same move to all boards; return new boards and scores. """
+    if move == SKIP:
+        return boards.copy(), np.zeros(len(boards), dtype=np.int64)
+    k, width, _ = boards.shape
+    oriented = _orient(boards, move)
+    rows, score = slide_left(oriented.reshape(k * width, width))
+    new = np.empty_like(boards)
+    _orient(new, move)[...] = rows.reshape(k, width, width)
+    return new, score.reshape(k, width).sum(axis=1)
+
+
+class BatchGame:
+    """ Class holding the state of K games with the same rules: boards,
+    scores, turns, and which games are still running.
+    """
+
+    def __init__(self, k, rules=slider_model.DEFAULT, field=None, seed=None):
+        """ Create K new games, or K copies of the given field, using a random
+        number generator with the given seed. """
+        self.rules = rules
+        self.rng = np.random.default_rng(seed)
+        self.scores = np.zeros(k, dtype=np.int64)
+        self.turns = np.zeros(k, dtype=np.int64)
+        self.running = np.ones(k, dtype=bool)
+        if field is None:
+            self.boards = np.zeros((k, rules.width, rules.width), dtype=np.int8)
+            self.spawn(rules.create_start)
+        else:
+            self.boards = np.repeat(np.array([field], dtype=np.int8), k, axis=0)
+
+    def valid_moves(self, which=None):
+        """ Get array (K, len(MOVE_LIST)) of valid moves of all games, or of
+        the games with the given indices, using the same checks as
+        SliderGame.valid_moves2, without applying moves. """
+        boards = self.boards if which is None else self.boards[which]
+        res = np.zeros((len(boards), len(MOVE_LIST)), dtype=bool)
+        for lines, back, forth in ((boards, 0, 1), (boards.transpose(0, 2, 1), 2, 3)):
+            a, b = lines[:, :, :-1], lines[:, :, 1:]
+            pairs = ((a == b) & (a != 0)).any(axis=(1, 2))
+            res[:, back]  = pairs | ((a == 0) & (b != 0)).any(axis=(1, 2))
+            res[:, forth] = pairs | ((a != 0) & (b == 0)).any(axis=(1, 2))
+        if self.rules.allow_noop:
+            res[:, 4] = (boards == 0).sum(axis=(1, 2)) >= self.rules.create_turn
+        return res
+
+    def apply_moves(self, moves, mask=None):
+        """ Apply move (index in MOVE_LIST) to each game where mask is set, and
+        spawn new numbers; add score and return the score of this turn. The
+        moves are assumed to be valid. """
+        mask = self.running if mask is None else mask
+        moves = np.asarray(moves)
+        gained = np.zeros(len(self.boards), dtype=np.int64)
+        for i, move in enumerate(MOVE_LIST):
+            which = np.flatnonzero(mask & (moves == i))
+            if len(which):
+                self.boards[which], gained[which] = slide(self.boards[which], move)
+        self.spawn(self.rules.create_turn, mask)
+        self.scores += gained
+        self.turns += mask
+        return gained
+
+    def spawn(self, n, mask=None):
+        """ Spawn up to n new numbers on random empty cells of each game where
+        mask is set, with the same distribution as SliderGame.new_random. """
+        k = len(self.boards)
+        games = np.arange(k) if mask is None else np.flatnonzero(mask)
+        flat = self.boards.reshape(k, -1)[games]
+        for _ in range(n):
+            # random key for each empty cell; the highest one gets the number
+            keys = np.where(flat == 0, self.rng.random(flat.shape), -1.)
+            cells = keys.argmax(axis=1)
+            which = np.flatnonzero(keys[np.arange(len(games)), cells] >= 0)
+            values = np.ones(len(which), dtype=np.int8)
+            for v in range(2, self.rules.create_max + 1):
+                values += (values == v - 1) & (self.rng.random(len(which)) < self.rules.prob_more)
+            flat[which, cells[which]] = values
+        self.boards.reshape(k, -1)[games] = flat
+
+    def random_moves(self, valid):
+        """ Choose random valid move for each game; -1 if there is none. """
+        keys = np.where(valid, self.rng.random(valid.shape), -1.)
+        moves = keys.argmax(axis=1)
+        moves[~valid.any(axis=1)] = -1
+        return moves
+
+    def random_play(self, max_turns=None):
+        """ Play random valid moves in all games until game over (or for the
+        given number of turns); return final scores. """
+        turn = 0
+        moves = np.full(len(self.boards), -1)
+        while self.running.any() and (max_turns is None or turn < max_turns):
+            # only look at games still running, which get fewer over time
+            which = np.flatnonzero(self.running)
+            moves[which] = self.random_moves(self.valid_moves(which))
+            self.running &= moves >= 0
+            self.apply_moves(moves)
+            turn += 1
+        return self.scores
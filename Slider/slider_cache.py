@@ -0,0 +1,138 @@
+"""
+Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
+Bounded cache of position values for the AI, e.g. heuristic values or values
+of nodes in the expectimax search, optionally persisted to a file.
+
+Positions are packed fields, reduced to a canonical form under the 8 symmetries
+of the field, plus a small tag (0-255) for distinguishing e.g. search depths.
+Entries are kept in memory with LRU eviction; entries loaded from file are not
+read into memory, but looked up in the memory-mapped file on demand.
+
+File format, all in little endian: header with magic, rules, and number of
+records, see HEADER; then the records, sorted by packed field and tag, see
+RECORD. Only fields with up to 64 bits (i.e. width up to 4) can be saved.
+"""
+
+import slider_model
+import collections, mmap, os, struct
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CACHE_SIZE = 1 << 18 # maximum number of entries in memory
+
+MAGIC  = b"SLIDEVAL"
+HEADER = struct.Struct("<8sBBBBdBQ")
+RECORD = struct.Struct("<QBd")
+
+
+class PositionCache:
+    """ Bounded mapping from positions to values, for one set of rules,
+    evicting the least recently used entry when full, and counting hits and
+    misses. Values should not depend on the orientation of the field, unless
+    symmetric is False.
+    """
+
+    def __init__(self, rules=slider_model.DEFAULT, size=CACHE_SIZE, symmetric=True):
+        self.rules = rules
+        self.tables = rules.tables
+        self.size = size
+        self.symmetric = symmetric
+        self.entries = collections.OrderedDict()
+        self.data = None
+        self.records = 0
+        self.hits = self.misses = 0
+
+    def key(self, packed, tag=0):
+        """ Get key for packed field and tag, using canonical form of field. """
+        if self.symmetric:
+            packed = min(self.tables.symmetries(packed))
+        return packed, tag
+
+    def get(self, key):
+        """ Get value for key, from memory or from file, or None. """
+        value = self.entries.get(key)
+        if value is None and self.data is not None:
+            value = self.find(key)
+            if value is not None:
+                self.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def find(self, key):
+        """ Get value for key from memory-mapped file by binary search. """
+        lo, hi = 0, self.records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            packed, tag, value = RECORD.unpack_from(self.data, HEADER.size + mid * RECORD.size)
+            if (packed, tag) == key:
+                return value
+            if (packed, tag) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def header(self, records):
+        r = self.rules
+        return HEADER.pack(MAGIC, r.width, r.create_start, r.create_turn, r.create_max,
+                           r.prob_more, r.allow_noop, records)
+
+    def load(self, path):
+        """ Memory-map cache file, if it exists and is for the same rules;
+        return whether it was loaded. """
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        records = HEADER.unpack_from(data)[-1] if len(data) >= HEADER.size else 0
+        if data[:HEADER.size] != self.header(records) or len(data) != HEADER.size + records * RECORD.size:
+            data.close()
+            return False
+        self.data, self.records = data, records
+        return True
+
+    def save(self, path):
+        """ Save entries in memory to file, merged with the entries currently
+        in that file (which may have been saved by another process since it
+        was loaded); the file is replaced atomically. Merging and writing is
+        done while holding a lock on a separate lock file (where supported),
+        so that processes saving at the same time do not lose entries. """
+        with open(path + ".lock", "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._merge_and_write(path)
+
+    def _merge_and_write(self, path):
+        records = {}
+        other = PositionCache(self.rules, symmetric=self.symmetric)
+        if other.load(path):
+            for i in range(other.records):
+                packed, tag, value = RECORD.unpack_from(other.data, HEADER.size + i * RECORD.size)
+                records[packed, tag] = value
+            other.data.close()
+        records.update((key, value) for key, value in self.entries.items() if key[0] < 1 << 64)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(self.header(len(records)))
+            for (packed, tag), value in sorted(records.items()):
+                f.write(RECORD.pack(packed, tag, value))
+        os.replace(tmp, path)
+
+    def hit_rate(self):
+        return self.hits / max(1, self.hits + self.misses)
+
+    def __str__(self):
+        return "Cache: %d/%d entries, %d in file, %d hits, %d misses, hit rate %.3f" % (
+                len(self.entries), self.size, self.records, self.hits, self.misses, self.hit_rate())
@@ -0,0 +1,137 @@
+"""
+Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
+Differential test harness for the different implementations of getting valid
+moves and updating the field in the game model.
+
+Random fields are fed to each implementation, and the results are compared to
+those of the simple reference implementations (valid_moves1, update_field1);
+every mismatch is reported, as well as the time taken by each implementation.
+"""
+
+import slider_model
+from slider_model import LEFT
+import collections, random, time
+
+# implementations of getting valid moves, the first being the reference
+VALID_MOVES = ["valid_moves1", "valid_moves2", "valid_moves3"]
+# implementations of updating the field, the first being the reference
+UPDATE_FIELD = ["update_field1", "update_field2", "update_field3"]
+# widths of the random fields, taking turns
+WIDTHS = [3, 4, 5, 6]
+
+
+def random_field(density, max_value, width=slider_model.WIDTH):
+    """ Create random field with given width and fraction of non-empty cells. """
+    return [[random.randint(1, max_value) if random.random() < density else 0
+             for _ in range(width)] for _ in range(width)]
+
+def timed(game, times, name, *args):
+    """ Call named method of game on a copy of its field, adding time taken to
+    times; return result and merged cells. """
+    method = getattr(game, name)
+    start = time.perf_counter()
+    result = game.isolated(method, *args)
+    times[name] += time.perf_counter() - start
+    return result
+
+def check_field(field, times):
+    """ Compare all implementations on the given field, with rules for its
+    width; return list of mismatches, each a tuple of implementation, move,
+    expected and actual. """
+    rules = slider_model.Rules(width=len(field))
+    game = slider_model.SliderGame.from_snapshot((0, 0, field, [], []), rules)
+    mismatches = []
+    # packed implementations only for fields that still fit after the move
+    packed = slider_model.fits_packed(field, 1)
+    valid_moves = VALID_MOVES if packed else VALID_MOVES[:2]
+    update_field = UPDATE_FIELD if packed else UPDATE_FIELD[:2]
+
+    ref, _ = timed(game, times, VALID_MOVES[0])
+    for name in valid_moves[1:]:
+        res, _ = timed(game, times, name)
+        if res != ref:
+            mismatches.append((name, None, ref, res))
+
+    for move in slider_model.MOVES:
+        ref, _ = timed(game, times, UPDATE_FIELD[0], move)
+        ref_merged = None
+        for name in update_field[1:]:
+            res, merged = timed(game, times, name, move)
+            if res != ref:
+                mismatches.append((name, move, ref, res))
+            # update_field1 does not record positions of merged cells
+            if ref_merged is None:
+                ref_merged = sorted(merged)
+            elif sorted(merged) != ref_merged:
+                mismatches.append((name + " merged", move, ref_merged, sorted(merged)))
+        if not packed:
+            continue
+
+        start = time.perf_counter()
+        packed, score = slider_model.slide(slider_model.pack(field), move, rules)
+        times["slide"] += time.perf_counter() - start
+        game.field, game.merged = ref, ref_merged
+        expected = game.calculate_score()
+        game.field = field
+        if slider_model.unpack(packed, rules) != ref:
+            mismatches.append(("slide", move, ref, slider_model.unpack(packed, rules)))
+        if score != expected:
+            mismatches.append(("slide score", move, expected, score))
+    return mismatches
+
+def check_overflow(strategies=None, turns=20):
+    """ Check that a merge of the highest values that can be packed (2^15 +
+    2^15) works, and that each AI strategy can play a few turns from there,
+    falling back to unpacked fields; return list of failed strategies. """
+    import slider_ai
+    field = [[0] * slider_model.WIDTH for _ in range(slider_model.WIDTH)]
+    field[0][:4] = [slider_model.MAX_VALUE, slider_model.MAX_VALUE, 3, 1]
+    game = slider_model.SliderGame.from_snapshot((0, 0, field, [], []), checked=True)
+    game.apply_move(LEFT, True, [])
+    failures = [] if game.field[0][0] == slider_model.MAX_VALUE + 1 else ["merge"]
+    for name in strategies or slider_ai.STRATEGIES:
+        game = slider_model.SliderGame.from_snapshot((0, 0, field, [], []))
+        try:
+            while game.turn < turns and game.valid_moves():
+                game.apply_move(slider_ai.STRATEGIES[name](game))
+        except OverflowError:
+            failures.append(name)
+    return failures
+
+def run(num_fields, max_value, verbose):
+    """ Check the given number of random fields of varying density and width
+    (see WIDTHS); print mismatches and timings, return number of mismatches. """
+    times = collections.Counter()
+    failures = collections.Counter()
+    for i in range(num_fields):
+        field = random_field(random.random(), max_value, WIDTHS[i % len(WIDTHS)])
+        for name, move, expected, actual in check_field(field, times):
+            failures[name] += 1
+            if verbose:
+                print("MISMATCH", name, move, field, expected, actual)
+
+    print("%d fields of width %s, %d mismatches" % (num_fields, "/".join(map(str, WIDTHS)),
+                                                    sum(failures.values())))
+    for name, count in sorted(failures.items()):
+        print("  %-20s %6d" % (name, count))
+    calls = {name: num_fields for name in VALID_MOVES}
+    calls.update((name, num_fields * len(slider_model.MOVES)) for name in UPDATE_FIELD + ["slide"])
+    for name in VALID_MOVES + UPDATE_FIELD + ["slide"]:
+        print("  %-20s %8.2f us per call" % (name, 1e6 * times[name] / max(1, calls[name])))
+    return sum(failures.values())
+
+
+if __name__ == "__main__":
+    import optparse, sys
+    parser = optparse.OptionParser("slider_check.py [Options]")
+    parser.add_option("-n", "--fields", dest="fields", type="int", default=10000, help="number of random fields")
+    parser.add_option("-m", "--max", dest="max", type="int", default=10, help="highest value (as power of two)")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=None, help="random seed")
+    parser.add_option("-v", "--verbose", dest="verbose", action="store_true", default=False, help="print each mismatch")
+    (options, args) = parser.parse_args()
+
+    random.seed(options.seed)
+    failures = run(options.fields, options.max, options.verbose)
+    overflow = check_overflow()
+    print("overflow check:", ", ".join(overflow) or "ok")
+    sys.exit(1 if failures or overflow else 0)
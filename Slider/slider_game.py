@@ -4,22 +4,31 @@ Simple graphical user interface for playing the game. No animation, yet, though.
 
 TODO
 - animation (still needed after highlighting?)
-- maybe allow undo once? or save/restore?
+- maybe allow undo once?
 """
 
-import slider_model
+import slider_model, slider_ai, slider_log
+import time
 import tkinter as tk
 import tkinter.font as tkf
 
+AUTO_SLICE = 0.02 # time for playing moves in autoplay before drawing the state
+AUTO_DELAY = 1    # delay before next autoplay slice, in ms
+
 class SliderFrame(tk.Frame):
     """ Class representing a simple UI for the Slider game.
     """
     
-    def __init__(self, master):
-        """ Create new instance of the frame. """
+    def __init__(self, master, strategy=None, log_path=None):
+        """ Create new instance of the frame, optionally with name of strategy
+        from slider_ai.STRATEGIES for autoplay, and file to record the game. """
         tk.Frame.__init__(self, master)
         self.master.title("Slider")
-        self.game = slider_model.SliderGame()
+        self.strategy = strategy
+        self.autoplay = False
+        self.log_path = log_path
+        self.log = None
+        self.new_game(slider_model.DEFAULT)
         
         self.pack(fill=tk.BOTH, expand=tk.YES)
         self.canvas = tk.Canvas(self, width=400, height=400)
@@ -27,13 +36,20 @@ class SliderFrame(tk.Frame):
         self.var = tk.StringVar()
         label = tk.Label(self, textvariable=self.var)
         label.pack(side=tk.BOTTOM)
+
+        # canvas items and last drawn state (value, merged, new) of each cell
+        self.font        = tkf.Font(family="Arial")
+        self.font_merged = tkf.Font(family="Arial", weight="bold")
+        self.items = {}
+        self.shown = {}
         
         self.bind_all("<KeyPress>", self.handle_keys)
-        self.bind("<Configure>", self.draw_state)
-        self.draw_state()
+        self.bind("<Configure>", self.layout)
+        self.layout()
         
     def handle_keys(self, event, shift=False):
-        """ Handle keys for movements and other actions (new game, guit). """
+        """ Handle keys for movements and other actions (new game, autoplay,
+        quit). """
         DIRECTIONS = {"Right": slider_model.RIGHT,
                       "Left":  slider_model.LEFT,
                       "Up":    slider_model.UP,
@@ -42,44 +58,98 @@ class SliderFrame(tk.Frame):
         if event.keysym == "q":
             self.quit()
         if event.keysym == "n":
-            self.game = slider_model.SliderGame()
+            self.new_game(self.game.rules)
             self.draw_state()
+        if event.keysym == "a" and self.strategy:
+            self.autoplay = not self.autoplay
+            if self.autoplay:
+                self.play_auto()
         if event.keysym in DIRECTIONS:
             move = DIRECTIONS[event.keysym]
-            if move in self.game.valid_moves():
-                self.game.apply_move(move)
+            if move in self.valid:
+                self.apply_move(move)
                 self.draw_state()
+
+    def new_game(self, rules):
+        """ Start new game, and new game log if recording. """
+        self.game = slider_model.SliderGame(rules)
+        self.valid = self.game.valid_moves()
+        if self.log_path:
+            if self.log:
+                self.log.close()
+            self.log = slider_log.LogWriter(self.log_path, self.game)
+
+    def apply_move(self, move):
+        """ Apply move to the game and update valid moves for the next turn. """
+        self.game.apply_move(move, False)
+        self.valid = self.game.valid_moves()
+        if self.log:
+            self.log.record(move)
+
+    def play_auto(self):
+        """ Play moves chosen by the AI strategy for a short time, then draw
+        the state once and schedule the next batch of moves, so that the UI
+        stays responsive even with hundreds of moves per second. """
+        if not self.autoplay:
+            return
+        best_move = slider_ai.STRATEGIES[self.strategy]
+        start = time.time()
+        while self.valid and time.time() - start < AUTO_SLICE:
+            self.apply_move(best_move(self.game))
+        self.draw_state()
+        if self.valid:
+            self.after(AUTO_DELAY, self.play_auto)
+        else:
+            self.autoplay = False
+
+    def layout(self, event=None):
+        """ Create or re-position canvas items of all cells and re-size fonts,
+        depending on current window size, then draw the current state. """
+        self.update_idletasks()
+        w = self.get_cellwidth()
+        self.font.configure(size=max(1, int(w)//3))
+        self.font_merged.configure(size=max(1, int(w)//3))
+        width = self.game.rules.width
+        if len(self.items) != width * width:
+            self.canvas.delete("all")
+            self.items = {(c, r): (self.canvas.create_rectangle(0, 0, 0, 0),
+                                   self.canvas.create_text(0, 0, anchor="center"))
+                          for r in range(width) for c in range(width)}
+            self.shown = {}
+        for (c, r), (rect, text) in self.items.items():
+            x, y = c*w, r*w
+            self.canvas.coords(rect, x, y, x+w, y+w)
+            self.canvas.coords(text, x+w/2, y+w/2)
+        self.draw_state()
         
     def draw_state(self, event=None):
-        """ Re-draw the current state of the game. """
-        self.update()
-        self.canvas.delete("all")
-        w = self.get_cellwidth()
-        font        = tkf.Font(family="Arial", size=int(w)//3)
-        font_merged = tkf.Font(family="Arial", size=int(w)//3, weight="bold")
+        """ Draw the current state of the game, only re-configuring the canvas
+        items of cells that changed since they were last drawn. """
+        merged, new = set(self.game.merged), set(self.game.new)
         for r, row in enumerate(self.game.field):
-            for c, col in enumerate(row):
-                value = self.game.field[r][c]
-                bg = int(255 * 0.95**(value)) if value else 255
-                the_font = font_merged if (c, r) in self.game.merged else font
-                x, y = c*w, r*w
-                self.canvas.create_rectangle(x, y, x+w, y+w, fill='#%02X%02X%02X' % (bg, bg, bg),
-                                             width=2 if (c, r) in self.game.new else 1)
-                if value != 0:
-                    self.canvas.create_text(x+w/2, y+w/2, text=to_str(value), anchor="center",
-                                            font=the_font)
+            for c, value in enumerate(row):
+                state = (value, (c, r) in merged, (c, r) in new)
+                if self.shown.get((c, r)) != state:
+                    self.shown[c, r] = state
+                    rect, text = self.items[c, r]
+                    bg = int(255 * 0.95**(value)) if value else 255
+                    self.canvas.itemconfigure(rect, fill='#%02X%02X%02X' % (bg, bg, bg),
+                                              width=2 if state[2] else 1)
+                    self.canvas.itemconfigure(text, text=to_str(value) if value else "",
+                                              font=self.font_merged if state[1] else self.font)
         self.update_status()
 
     def update_status(self):
         """ Update status line with turn number, score and game over or not. """
-        self.var.set("Turn %d, Score %d" % (self.game.turn, self.game.score))
-        if self.game.is_game_over():
-            self.var.set(self.var.get() + "\n GAME OVER")
+        status = "Turn %d, Score %d" % (self.game.turn, self.game.score)
+        if not self.valid:
+            status += "\n GAME OVER"
+        self.var.set(status)
 
     def get_cellwidth(self):
         """ Get width of cells, depending on current window size. """
         width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
-        return min(height, width) / slider_model.WIDTH
+        return min(height, width) / self.game.rules.width
 
 def to_str(value):
     #~return str(value)
@@ -87,10 +157,22 @@ def to_str(value):
 
 
 def main():
-    """ Start Slider game. """
+    """ Start Slider game; press 'a' to toggle autoplay by the AI. """
+    import optparse
+    parser = optparse.OptionParser("slider_game.py [Options]")
+    parser.add_option("-s", "--strategy", dest="strategy", default="heuristic",
+                      help="strategy for autoplay, one of " + ", ".join(slider_ai.STRATEGIES))
+    parser.add_option("-l", "--log", dest="log", default=None,
+                      help="record current game to log file, see slider_log.py")
+    (options, args) = parser.parse_args()
+    if options.strategy not in slider_ai.STRATEGIES:
+        parser.error("Unknown strategy, use one of: " + ", ".join(slider_ai.STRATEGIES))
+
     root = tk.Tk()
-    frame = SliderFrame(root)
+    frame = SliderFrame(root, options.strategy, options.log)
     frame.mainloop()
+    if frame.log:
+        frame.log.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+"""
+Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
+Compact binary log of played games, for saving and replaying games and for
+extracting positions for benchmarking or training the AI.
+
+File format, all in little endian:
+- header: magic, rules (width, create_start, create_turn, create_max,
+  prob_more, allow_noop) and random seed, see HEADER
+- start: number of numbers spawned at the start, then one byte per spawn
+- one record per turn: one byte with the move (index in MOVES) in the lower
+  three bits and the number of spawns in the upper five bits, then one byte
+  per spawn with the cell (y * width + x) in the lower six bits and the value
+  minus one (as power of two) in the upper two bits
+"""
+
+import slider_model
+from slider_model import LEFT, RIGHT, UP, DOWN, SKIP
+import struct
+
+MAGIC  = b"SLIDELOG"
+HEADER = struct.Struct("<8sBBBBdBQ")
+MOVES  = [LEFT, RIGHT, UP, DOWN, SKIP]
+
+SNAPSHOT_EVERY = 100 # turns between snapshots for replaying games
+
+
+def _encode_spawns(game, cells):
+    """ Encode spawned cells of game as bytes, with count in front. """
+    width = game.rules.width
+    return bytes([len(cells)] + [y * width + x | (game.field[y][x] - 1) << 6 for x, y in cells])
+
+def _decode_spawn(b, width):
+    """ Decode spawn byte to tuple (x, y, value). """
+    cell = b & 63
+    return cell % width, cell // width, (b >> 6) + 1
+
+class LogWriter:
+    """ Streaming writer for the log of a single game, appending a record
+    after each move. Use as context manager, or close when done.
+    """
+
+    def __init__(self, path, game, seed=0):
+        """ Create log file for new game (before the first move). """
+        rules = game.rules
+        if game.turn != 0:
+            raise ValueError("can only log games from the start")
+        if rules.width > 8 or rules.create_max > 4 or rules.create_turn > 31:
+            raise ValueError("rules not supported by log format: %r" % (rules,))
+        self.game = game
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, rules.width, rules.create_start, rules.create_turn,
+                                    rules.create_max, rules.prob_more, rules.allow_noop, seed))
+        self.file.write(_encode_spawns(game, game.new))
+
+    def record(self, move):
+        """ Append record for move that has just been applied to the game. """
+        spawns = _encode_spawns(self.game, self.game.new)
+        self.file.write(bytes([MOVES.index(move) | spawns[0] << 3]) + spawns[1:])
+
+    def flush(self):
+        """ Write buffered records to the file, e.g. to read it while playing. """
+        self.file.flush()
+
+    def close(self):
+        """ Close the log file; no more records can be appended. """
+        self.file.close()
+
+    def __enter__(self):
+        """ Use the writer as context manager, see __exit__. """
+        return self
+
+    def __exit__(self, *args):
+        """ Close the log file when leaving the context, also on errors. """
+        self.close()
+
+class GameLog:
+    """ Log of a single game read from file, with rules, seed, start, and
+    moves and spawns of all turns. Games can be replayed up to any turn; for
+    fast seeking, snapshots are kept every SNAPSHOT_EVERY turns.
+    """
+
+    def __init__(self, data):
+        """ Parse log from bytes. """
+        magic, width, create_start, create_turn, create_max, prob_more, allow_noop, self.seed = \
+                HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a slider game log")
+        self.rules = slider_model.Rules(width, create_start, create_turn, create_max, prob_more, allow_noop)
+        i = HEADER.size
+        self.start = [_decode_spawn(b, width) for b in data[i+1:i+1+data[i]]]
+        i += 1 + data[i]
+        self.moves, self.spawns = [], []
+        while i < len(data):
+            n = data[i] >> 3
+            self.moves.append(MOVES[data[i] & 7])
+            self.spawns.append([_decode_spawn(b, width) for b in data[i+1:i+1+n]])
+            i += 1 + n
+        field = [[0] * width for _ in range(width)]
+        for x, y, value in self.start:
+            field[y][x] = value
+        self.snapshots = {0: (0, 0, field, [(x, y) for x, y, _ in self.start], [])}
+
+    @classmethod
+    def load(cls, path):
+        """ Read log from file. """
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def __len__(self):
+        """ Number of turns in the log. """
+        return len(self.moves)
+
+    def game_at(self, turn=None):
+        """ Get SliderGame with state after the given turn (default: the end),
+        replaying from the nearest snapshot before that turn. """
+        turn = len(self) if turn is None else min(turn, len(self))
+        base = turn - turn % SNAPSHOT_EVERY
+        while base not in self.snapshots:
+            base -= SNAPSHOT_EVERY
+        game = slider_model.SliderGame.from_snapshot(self.snapshots[base], self.rules)
+        for t in range(base, turn):
+            game.apply_move(self.moves[t], False, self.spawns[t])
+            if game.turn % SNAPSHOT_EVERY == 0:
+                self.snapshots[game.turn] = game.snapshot()
+        return game
+
+    def positions(self, every=1):
+        """ Generate tuples (turn, packed field, score) of every n-th turn of
+        the game, replaying the game on the packed field, which is faster
+        than using SliderGame. Stops at the first field with a value that is
+        too large for packing. """
+        t = self.rules.tables
+        width = self.rules.width
+        packed = slider_model.pack(self.snapshots[0][2])
+        score = 0
+        for turn, (move, spawns) in enumerate(zip(self.moves, self.spawns)):
+            if turn % every == 0:
+                yield turn, packed, score
+            try:
+                packed, s = t.slide(packed, move)
+            except OverflowError:
+                return
+            score += s
+            for x, y, value in spawns:
+                packed |= value << ((y * width + x) * slider_model.BITS)
+        if len(self) % every == 0:
+            yield len(self), packed, score
+
+def scan(paths, every=1):
+    """ Scan many game logs, generating tuples (path, rules, turn, packed
+    field, score) of every n-th turn of each game, e.g. for extracting
+    benchmark positions for the AI. """
+    for path in paths:
+        log = GameLog.load(path)
+        for turn, packed, score in log.positions(every):
+            yield path, log.rules, turn, packed, score
+
+def load_positions(paths, every=1):
+    """ Get list of games with positions from many game logs, see scan. """
+    return [slider_model.SliderGame.from_snapshot((turn, score, slider_model.unpack(packed, rules), [], []), rules)
+            for _, rules, turn, packed, score in scan(paths, every)]
+
+
+if __name__ == "__main__":
+    import optparse
+    parser = optparse.OptionParser("slider_log.py [Options] LOGFILE [LOGFILE ...]")
+    parser.add_option("-t", "--turn", dest="turn", type="int", default=None, help="show game after turn")
+    (options, args) = parser.parse_args()
+
+    for path in args:
+        log = GameLog.load(path)
+        game = log.game_at(options.turn)
+        print(path, "seed", log.seed, "turns", len(log))
+        game.show()
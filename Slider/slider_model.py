@@ -2,13 +2,14 @@
 Slider Game, inspired by '2048', but with more options. Tobias Küster, 2019
 Game model, incl. rules for applying moves, updating the field, scoring, etc.
 
-TODO
-- make application of moves more efficient (for AI random plays)
-- wrap configuration into separate class or namedtuple
-- problem when creating more than one but not enough space
+There are several methods each for getting valid moves and for updating the
+field: the methods 2 on the unpacked field are used by default, the methods 3
+on packed fields are used by the AI, which works on packed states, and the
+methods 1 are the simple reference versions. All of them can be cross-checked
+in checked mode, or using the differential test harness in slider_check.py.
 """
 
-import random
+import random, collections
 
 WIDTH        = 4  # width and height of the playing field
 CREATE_START = 2  # how many number to create when game starts
@@ -16,6 +17,7 @@ CREATE_TURN  = 1  # how many number to create in each turn
 CREATE_MAX   = 2  # maximum number to create (as power of two)
 PROB_MORE    = .1 # probability for increasing the new number
 ALLOW_NOOP   = 1  # allow no-op / skip move?
+CHECKED      = 0  # cross-check fast methods against reference methods?
 
 # available moves; numbers mean MoveDir, Start, Delta
 LEFT, RIGHT, UP, DOWN, SKIP = "LEFT RIGHT UP DOWN SKIP".split()
@@ -25,39 +27,128 @@ MOVES = {UP:    (( 0,+1), (0,0), (1,0)),
          RIGHT: ((-1,+0), (1,0), (0,1)),
          SKIP:  None}
 
+# packed field: whole field in one integer, BITS bits per cell, row by row,
+# starting with the top-left cell; moves are applied to entire rows, using
+# transition tables that are filled on first use, see PackedTables
+BITS      = 4
+MAX_VALUE = (1 << BITS) - 1 # highest value (as power of two) that can be packed
+CELL_MASK = (1 << BITS) - 1
+
+
+class Rules(collections.namedtuple("Rules", "width create_start create_turn create_max prob_more allow_noop",
+                                   defaults=(WIDTH, CREATE_START, CREATE_TURN, CREATE_MAX, PROB_MORE, ALLOW_NOOP))):
+    """ Immutable configuration of the rules of the game, see the constants
+    above for the defaults and meaning of the fields. The tables for packed
+    fields are shared by all rules with the same width.
+    """
+    __slots__ = ()
+
+    @property
+    def tables(self):
+        """ Get tables for packed fields for the width of these rules. """
+        return _TABLES.get(self.width) or PackedTables(self.width)
+
+    @property
+    def moves(self):
+        """ Get all moves allowed by these rules, valid or not. """
+        return [LEFT, RIGHT, UP, DOWN, SKIP] if self.allow_noop else [LEFT, RIGHT, UP, DOWN]
+
+    def spawn_probabilities(self):
+        """ Get list of numbers that can be spawned (as power of two) and
+        their probabilities, according to SliderGame.new_random. """
+        probs, p = [], 1.
+        for n in range(1, self.create_max):
+            probs.append((n, p * (1 - self.prob_more)))
+            p *= self.prob_more
+        probs.append((self.create_max, p))
+        return [(n, p) for n, p in probs if p > 0]
+
+DEFAULT = Rules()
+
 class SliderGame:
     """ Class representing the current state of the slider game
     """
+    __slots__ = ("rules", "checked", "turn", "score", "field", "new", "merged", "history")
     
-    def __init__(self):
-        """ Create new instance and initialize fields. """
+    def __init__(self, rules=DEFAULT, checked=CHECKED):
+        """ Create new instance for the given rules and initialize fields. In
+        checked mode, the fast methods for getting valid moves and updating the
+        field are cross-checked against the slower reference methods in each
+        turn. """
+        self.rules = rules
+        self.checked = checked
         self.turn = 0
         self.score = 0
-        self.field = [[0 for _ in range(WIDTH)] for _ in range(WIDTH)]
-        self.new = self.spawn(CREATE_START)
+        self.field = [[0 for _ in range(rules.width)] for _ in range(rules.width)]
+        self.new = self.spawn(rules.create_start)
         self.merged = []
-        
-        self.valid_moves = self.valid_moves2
-        self.update_field = self.update_field2
+        self.history = []
+
+    @classmethod
+    def from_snapshot(cls, state, rules=DEFAULT, checked=CHECKED):
+        """ Create new instance with state from a snapshot, without spawning
+        new numbers as the constructor does. """
+        game = cls.__new__(cls)
+        game.rules, game.checked, game.history = rules, checked, []
+        game.restore(state)
+        return game
+
+    def clone(self):
+        """ Create copy of this game with same state, but without history. """
+        return SliderGame.from_snapshot(self.snapshot(), self.rules, self.checked)
+
+    def snapshot(self):
+        """ Get state of the game (turn, score, field, new and merged cells)
+        as a tuple, which is not affected by later moves. """
+        return self.turn, self.score, [line[:] for line in self.field], self.new[:], self.merged[:]
+
+    def restore(self, state):
+        """ Restore state of the game from a snapshot. The snapshot can be
+        restored again later. """
+        turn, score, field, new, merged = state
+        self.turn, self.score = turn, score
+        self.field, self.new, self.merged = [line[:] for line in field], new[:], merged[:]
+
+    def push(self):
+        """ Push snapshot of current state to the undo stack, e.g. before
+        applying a move that shall be reverted later. """
+        self.history.append(self.snapshot())
+
+    def undo(self):
+        """ Revert to last state pushed to the undo stack; return whether
+        there was any. The snapshot is not copied again when restoring. """
+        if not self.history:
+            return False
+        self.turn, self.score, self.field, self.new, self.merged = self.history.pop()
+        return True
     
     def new_random(self):
         """ Create new random number; increase number with certain probability
         or until maximum value for new number is reached. """
         n = 1
-        while n < CREATE_MAX and random.random() < PROB_MORE:
+        while n < self.rules.create_max and random.random() < self.rules.prob_more:
             n += 1
         return n
     
     def spawn(self, n):
         """ Randomly spawn certain amount of new numbers on empty cells. """
-        self.new = random.sample(self.empty_cells(), n)
+        empty = self.empty_cells()
+        self.new = random.sample(empty, min(n, len(empty)))
         for x,y in self.new:
             self.field[y][x] = self.new_random()
         return self.new
+
+    def place(self, spawns):
+        """ Place given new numbers, as list of (x, y, value), instead of
+        spawning random ones, e.g. when replaying a recorded game. """
+        self.new = [(x, y) for x, y, _ in spawns]
+        for x, y, value in spawns:
+            self.field[y][x] = value
+        return self.new
     
     def empty_cells(self):
         """ Get empty cells. """
-        return [(x,y) for x in range(WIDTH) for y in range(WIDTH)
+        return [(x,y) for x in range(self.rules.width) for y in range(self.rules.width)
                 if self.field[y][x] == 0]
 
     def is_game_over(self):
@@ -65,12 +156,21 @@ class SliderGame:
         return not self.valid_moves()
 
     def valid_moves(self):
-        """ Helper method for testing/comparing different methods of getting
-        valid moves. """
-        v1 = self.valid_moves1()
+        """ Get valid moves, using the fastest method for unpacked fields; the
+        packed-field method has to pack the field first, see slider_check.py. """
+        if self.checked:
+            return self.valid_moves_checked()
+        return self.valid_moves2()
+
+    def valid_moves_checked(self):
+        """ Get valid moves, cross-checking all the different methods against
+        each other, except the packed one if the field might not fit; only for
+        testing, see CHECKED. """
+        v1 = self.isolated(self.valid_moves1)[0]
         v2 = self.valid_moves2()
-        if v1 != v2:
-            print(v1, v2)
+        v3 = self.valid_moves3() if fits_packed(self.field, 1) else v2
+        if not v1 == v2 == v3:
+            print("VALID MOVES MISMATCH", v1, v2, v3, self.field)
         return v2
     
     def valid_moves2(self):
@@ -95,29 +195,45 @@ class SliderGame:
         moves = set()
         moves |= _get_moves(     self.field,  LEFT, RIGHT)
         moves |= _get_moves(zip(*self.field), UP,   DOWN)
-        if ALLOW_NOOP and sum(line.count(0) for line in self.field) >= CREATE_TURN:
+        if self.rules.allow_noop and sum(line.count(0) for line in self.field) >= self.rules.create_turn:
             moves.add(SKIP)
         return sorted(moves)
     
+    def valid_moves3(self):
+        """ Get valid moves by applying the moves to the packed field, which is
+        fast enough to just try all of them. """
+        packed = pack(self.field)
+        moves = [m for m in (LEFT, RIGHT, UP, DOWN) if slide(packed, m, self.rules)[0] != packed]
+        if self.rules.allow_noop and count_empty(packed, self.rules) >= self.rules.create_turn:
+            moves.append(SKIP)
+        return sorted(moves)
+
     def valid_moves1(self):
         """ Get valid moves by trying to apply the different moves and seeing if
-        anything changes; this is somewhat "safer", but much slower. """
+        anything changes; this is somewhat "safer", but much slower. Skipping
+        never changes anything, so it is valid if there is room for new cells. """
         moves = set()
         for move in MOVES:
-            if ALLOW_NOOP or move != SKIP:
-                new_field = self.update_field(move)
+            if move != SKIP:
+                new_field = self.update_field1(move)
                 if new_field != self.field:
                     moves.add(move)
+        if self.rules.allow_noop and len(self.empty_cells()) >= self.rules.create_turn:
+            moves.add(SKIP)
         return sorted(moves)
         
-    def apply_move(self, move, check_valid=True):
-        """ Apply the given move, update score, and spawn new cells. Optionally
-        check whether the move is valid first. """
+    def apply_move(self, move, check_valid=True, spawns=None):
+        """ Apply the given move, update score, and spawn new cells, or place
+        the given new cells (see place). Optionally check whether the move is
+        valid first. """
         if not check_valid or move in self.valid_moves():
             self.turn += 1
             self.merged = []
             self.field = self.update_field(move)
-            self.spawn(CREATE_TURN)
+            if spawns is None:
+                self.spawn(self.rules.create_turn)
+            else:
+                self.place(spawns)
             score = self.calculate_score()
             self.score += score
             return score
@@ -125,13 +241,35 @@ class SliderGame:
             print("INVALID MOVE")
 
     def update_field(self, move):
-        """ Helper method for testing/comparing different methods of updating
-        the playing field. """
-        ref = self.update_field1(move)
-        res = self.update_field2(move)
-        if ref != res:
-            print(move, self.field)
-        return res
+        """ Update the field, using the fastest method for unpacked fields; the
+        packed-field method has to pack the field first, see slider_check.py. """
+        if self.checked:
+            return self.update_field_checked(move)
+        return self.update_field2(move)
+
+    def update_field_checked(self, move):
+        """ Update the field, cross-checking all the different methods against
+        each other, including positions of merged cells, except the packed one
+        if the field might not fit; only for testing, see CHECKED. """
+        ref, _ = self.isolated(self.update_field1, move)
+        res2, merged2 = self.isolated(self.update_field2, move)
+        res3, merged3 = (self.isolated(self.update_field3, move) if fits_packed(self.field, 1)
+                         else (res2, merged2))
+        if not ref == res2 == res3 or sorted(merged2) != sorted(merged3):
+            print("UPDATE FIELD MISMATCH", move, self.field)
+        self.merged.extend(merged2)
+        return res2
+
+    def isolated(self, method, *args):
+        """ Call method on a copy of the field and with fresh list of merged
+        cells, so that in-place methods can be compared; return result and
+        merged cells, leaving field and merged cells of this game unchanged. """
+        field, merged = self.field, self.merged
+        self.field, self.merged = list(map(list, field)), []
+        try:
+            return method(*args), self.merged
+        finally:
+            self.field, self.merged = field, merged
 
     def update_field1(self, move):
         """ Update the field by "compressing" the different rows or columns of
@@ -161,13 +299,14 @@ class SliderGame:
         
         if move == SKIP: return res
         (mx,my),(sx,sy),(dx,dy) = MOVES[move]
+        width = self.rules.width
         
-        for i in range(WIDTH):
-            px = (WIDTH-1) * sx + i * dx
-            py = (WIDTH-1) * sy + i * dy
+        for i in range(width):
+            px = (width-1) * sx + i * dx
+            py = (width-1) * sy + i * dy
             
             last = w = 0
-            for r in range(WIDTH):
+            for r in range(width):
                 cur = res[py + my * r][px + mx * r]
                 if cur != 0:
                     wx, wy = px + mx * w, py + my * w
@@ -181,11 +320,29 @@ class SliderGame:
                         res[wy][wx] = last
                         w += 1
                     last = cur
-            for w in range(w, WIDTH):
+            for w in range(w, width):
                 res[py + my * w][px + mx * w] = last or 0
                 last = 0
         return res
 
+    def update_field3(self, move):
+        """ Update the field by packing it into a single integer and applying
+        the move to entire rows using transition tables. Not in-place. """
+        t = self.rules.tables
+        packed = pack(self.field)
+        if move == SKIP: return t.unpack(packed)
+        transposed = move in (UP, DOWN)
+        if transposed: packed = t.transpose(packed)
+        table = t.left if move in (LEFT, UP) else t.right
+        res = 0
+        for y in range(t.width):
+            shift = y * t.row_bits
+            row, _, merged = table.get((packed >> shift) & t.row_mask) or \
+                             t.fill(table, (packed >> shift) & t.row_mask)
+            res |= row << shift
+            self.merged.extend((y, x) if transposed else (x, y) for x in merged)
+        return t.unpack(t.transpose(res) if transposed else res)
+
     def _compress(self, line):
         """ Compress a single row of column; this is not in-place but creates
         and returns a new list. """
@@ -200,7 +357,7 @@ class SliderGame:
                 if last is not None:
                     res.append(last)
                 last = c
-        while len(res) < WIDTH:
+        while len(res) < self.rules.width:
             res.append(last or 0)
             last = 0
         return res
@@ -218,6 +375,229 @@ class SliderGame:
             print(*("%2d" % c for c in line))
 
 
+# FUNCTIONS FOR PACKED FIELDS
+
+# tables for packed fields, by width of the field
+_TABLES = {}
+
+class PackedTables:
+    """ Constants and transition tables for packed fields of a certain width.
+    The transition tables for moving rows to the left or right hold the new
+    row, score and merged cells; those for moving transposed rows up or down
+    the same, but with new row spread to a column, for directly putting it into
+    the untransposed field. All those tables are filled on first use.
+    """
+    __slots__ = ("width", "row_bits", "row_mask", "low_bits", "shifts",
+                 "left", "right", "up", "down", "spread", "reverse")
+
+    def __init__(self, width):
+        self.width = width
+        self.row_bits = width * BITS
+        self.row_mask = (1 << self.row_bits) - 1
+        # lowest bit of each cell, for finding empty cells
+        self.low_bits = sum(1 << (i * BITS) for i in range(width * width))
+        # bit positions of the cells, row by row, for unpacking
+        self.shifts = [[(y * width + x) * BITS for x in range(width)] for y in range(width)]
+        self.left, self.right, self.up, self.down = {}, {}, {}, {}
+        # spread cells of a row to a column, for transposing
+        self.spread = {}
+        # reversed rows, for mirroring
+        self.reverse = {}
+        _TABLES[width] = self
+
+    def fill(self, table, row):
+        """ Calculate and add entry for row to one of the transition tables. """
+        cells = [(row >> (x * BITS)) & CELL_MASK for x in range(self.width)]
+        if table is self.left or table is self.up:
+            new, score, merged = _slide_line(cells)
+        else:
+            new, score, merged = _slide_line(cells[::-1])
+            new, merged = new[::-1], [self.width - 1 - x for x in merged]
+        new = sum(c << (x * BITS) for x, c in enumerate(new))
+        if table is self.up or table is self.down:
+            new = self.spread.get(new) or self.spread_row(new)
+        entry = new, score, merged
+        table[row] = entry
+        return entry
+
+    def spread_row(self, row):
+        """ Calculate and add entry for row to the table for transposing. """
+        spread = sum(((row >> (x * BITS)) & CELL_MASK) << (x * self.row_bits) for x in range(self.width))
+        self.spread[row] = spread
+        return spread
+
+    def unpack(self, packed):
+        """ Unpack integer to field (list of rows). """
+        return [[(packed >> i) & CELL_MASK for i in row] for row in self.shifts]
+
+    def transpose(self, packed):
+        """ Transpose packed field, i.e. swap rows and columns. """
+        res = 0
+        spread, row_bits, row_mask = self.spread, self.row_bits, self.row_mask
+        for y in range(self.width):
+            row = (packed >> (y * row_bits)) & row_mask
+            res |= (spread.get(row) or self.spread_row(row)) << (y * BITS)
+        return res
+
+    def mirror(self, packed):
+        """ Mirror packed field horizontally, i.e. reverse each row. """
+        res = 0
+        reverse, row_bits, row_mask = self.reverse, self.row_bits, self.row_mask
+        for y in range(self.width):
+            row = (packed >> (y * row_bits)) & row_mask
+            rev = reverse.get(row)
+            if rev is None:
+                rev = reverse[row] = sum(((row >> (x * BITS)) & CELL_MASK) << ((self.width - 1 - x) * BITS)
+                                         for x in range(self.width))
+            res |= rev << (y * row_bits)
+        return res
+
+    def flip(self, packed):
+        """ Flip packed field vertically, i.e. reverse order of rows. """
+        res = 0
+        row_bits, row_mask = self.row_bits, self.row_mask
+        for y in range(self.width):
+            res = res << row_bits | (packed >> (y * row_bits)) & row_mask
+        return res
+
+    def symmetries(self, packed):
+        """ Get the 8 symmetric variants of packed field (rotations and
+        reflections), starting with the field itself. """
+        transposed = self.transpose(packed)
+        mirrored, mirrored_t = self.mirror(packed), self.mirror(transposed)
+        flip = self.flip
+        return [packed, mirrored, flip(packed), flip(mirrored),
+                transposed, mirrored_t, flip(transposed), flip(mirrored_t)]
+
+    def slide(self, packed, move):
+        """ Apply move to packed field; return new packed field and score. """
+        if move == SKIP: return packed, 0
+        res = score = 0
+        row_bits, row_mask = self.row_bits, self.row_mask
+        if move == LEFT or move == RIGHT:
+            table = self.left if move == LEFT else self.right
+            for y in range(self.width):
+                shift = y * row_bits
+                row = (packed >> shift) & row_mask
+                new, s, _ = table.get(row) or self.fill(table, row)
+                res |= new << shift
+                score += s
+        else:
+            table = self.up if move == UP else self.down
+            transposed = self.transpose(packed)
+            for x in range(self.width):
+                row = (transposed >> (x * row_bits)) & row_mask
+                new, s, _ = table.get(row) or self.fill(table, row)
+                res |= new << (x * BITS)
+                score += s
+        return res, score
+
+    def empty_mask(self, packed):
+        """ Get mask with lowest bit of each empty cell in packed field set. """
+        mask = packed
+        for i in range(1, BITS):
+            mask |= packed >> i
+        return ~mask & self.low_bits
+
+def pack(field):
+    """ Pack field (list of rows) into a single integer. """
+    if max(map(max, field)) > MAX_VALUE:
+        raise OverflowError("value too large for packed field: %d" % max(map(max, field)))
+    packed = 0
+    for line in reversed(field):
+        for c in reversed(line):
+            packed = packed << BITS | c
+    return packed
+
+def fits_packed(field, moves=0):
+    """ Check whether field can be packed, also after the given number of
+    moves, each of which increases the highest value by at most one. """
+    return max(map(max, field)) + moves <= MAX_VALUE
+
+def unpack(packed, rules=DEFAULT):
+    """ Unpack integer to field (list of rows). """
+    return rules.tables.unpack(packed)
+
+def _slide_line(cells):
+    """ Slide list of cells towards index 0, merging pairs of equal cells, same
+    as in _compress; return new cells, score of merged cells, and indices of
+    merged cells. """
+    res, merged, score, last = [], [], 0, None
+    for c in filter(None, cells):
+        if c == last:
+            if c >= MAX_VALUE:
+                raise OverflowError("value too large for packed field: %d" % (c + 1))
+            res[-1] = c + 1
+            merged.append(len(res) - 1)
+            score += 2 ** (c + 1)
+            last = None
+        else:
+            res.append(c)
+            last = c
+    return res + [0] * (len(cells) - len(res)), score, merged
+
+def transpose(packed, rules=DEFAULT):
+    """ Transpose packed field, i.e. swap rows and columns. """
+    return rules.tables.transpose(packed)
+
+def slide(packed, move, rules=DEFAULT):
+    """ Apply move to packed field; return new packed field and score. """
+    return rules.tables.slide(packed, move)
+
+def empty_mask(packed, rules=DEFAULT):
+    """ Get mask with lowest bit of each empty cell in packed field set. """
+    return rules.tables.empty_mask(packed)
+
+def count_empty(packed, rules=DEFAULT):
+    """ Count empty cells in packed field. """
+    return bin(empty_mask(packed, rules)).count("1")
+
+def empty_cells_packed(packed, rules=DEFAULT):
+    """ Get indices (y * width + x) of empty cells in packed field. """
+    mask = empty_mask(packed, rules)
+    return [i for i in range(rules.width * rules.width) if mask >> (i * BITS) & 1]
+
+def spawn_packed(packed, n, rules=DEFAULT):
+    """ Randomly spawn n new numbers on empty cells of the packed field, or as
+    many as there are empty cells. Empty cells are found by trying random
+    cells, which is faster than listing empty cells if the field is not full. """
+    n = min(n, count_empty(packed, rules))
+    rnd = random.random
+    cells = rules.width * rules.width
+    while n:
+        i = int(rnd() * cells) * BITS
+        if not (packed >> i) & CELL_MASK:
+            v = 1
+            while v < rules.create_max and rnd() < rules.prob_more:
+                v += 1
+            packed |= v << i
+            n -= 1
+    return packed
+
+def random_play_packed(packed, rules=DEFAULT):
+    """ Perform random valid moves on packed field until no move is valid;
+    return total score and list of moves. A random valid move is found by
+    trying random moves and dropping the invalid ones. """
+    score, moves = 0, []
+    t, all_moves, create_turn = rules.tables, rules.moves, rules.create_turn
+    rnd = random.random
+    while True:
+        candidates = all_moves[:]
+        while candidates:
+            i = int(rnd() * len(candidates))
+            move = candidates[i]
+            new, s = t.slide(packed, move)
+            if new != packed or (move == SKIP and bin(t.empty_mask(packed)).count("1") >= create_turn):
+                break
+            candidates[i] = candidates[-1]
+            candidates.pop()
+        else:
+            return score, moves
+        packed = spawn_packed(new, create_turn, rules)
+        score += s
+        moves.append(move)
+
+
 def main():
     """ Very simple way of playing the game on console; for testing, but now
     entirely obsolete. """
@@ -1,3 +1,13 @@
+/*
+ * Ultimate Tic Tac Toe, playout engine in C
+ *
+ * standalone:     gcc -O3 -o uttt uttt.c
+ * shared library: gcc -O3 -shared -fPIC -o libuttt.so uttt.c
+ *
+ * The shared library is loaded by uttt.py via ctypes, if present, and used
+ * for evaluating moves; see uttt_evaluate_moves for the interface.
+ */
+
 #include <stdio.h>
 #include <stdlib.h>
 #include <time.h>
@@ -5,6 +15,7 @@
 
 const int NONE = 0, OWN = 1, OPP = -1, DRAW = 2;
 const char SYMBOLS[] = {'.', 'X', '#', 'O'};
+const double TIMEOUT = 0.5;
 
 /*
  * BOARD REPRESENTATION AND MANIPULATION
@@ -62,19 +73,44 @@ void get_moves(struct board *b, int last, int moves[]) {
     for (i = 0; i < 81; i++) {
         int index_meta = idx_meta(i);
         int index_inner = idx_inner(i);
-        int is_free = b->field[index_meta][index_inner] == NONE;
+        int is_free = b->meta[index_meta] == NONE && b->field[index_meta][index_inner] == NONE;
         int can_play = (index_meta == active_field) || any_field;
         moves[i] = is_free && can_play;
     }
 }
 
+/*
+ * get valid moves as list of move indices, return number of moves;
+ * faster than get_moves, only checking the active field, if any
+ */
+int list_moves(struct board *b, int last, int moves[]) {
+    int active_field = last == -1 ? -1 : idx_inner(last);
+    int n = 0, i, k, from = 0, to = 9;
+    if (active_field != -1 && b->meta[active_field] == NONE) {
+        from = active_field;
+        to = active_field + 1;
+    }
+    for (i = from; i < to; i++) {
+        if (b->meta[i] != NONE) continue;
+        for (k = 0; k < 9; k++) {
+            if (b->field[i][k] == NONE) {
+                moves[n++] = ((i / 3) * 3 + k / 3) * 9 + (i % 3) * 3 + k % 3;
+            }
+        }
+    }
+    return n;
+}
+
+/*
+ * in case of no line, player with more smaller boards wins
+ */
 int winning_draw(int field[], int player) {
-    return 0;
-	//~""" In case of no line, player with more smaller boards wins
-	//~"""
-	//~own = sum(1 for c in board if c == +player)
-	//~opp = sum(1 for c in board if c == -player)
-	//~return player if (own > opp) else (-player if opp > own else 0)    
+    int i, own = 0, opp = 0;
+    for (i = 0; i < 9; i++) {
+        if (field[i] == +player) own++;
+        if (field[i] == -player) opp++;
+    }
+    return own > opp ? player : (opp > own ? -player : 0);
 }
 
 int winning(int field[], int player) {
@@ -145,92 +181,157 @@ void show_moves(int moves[]) {
  * stuff related to which moves to take, independent of board data structure
  */
 
+/*
+ * xorshift random number generator, faster than rand()
+ */
+unsigned int rng_state = 2463534242u;
+
+unsigned int next_random() {
+    rng_state ^= rng_state << 13;
+    rng_state ^= rng_state >> 17;
+    rng_state ^= rng_state << 5;
+    return rng_state;
+}
+
 int random_move(int moves[]) {
     int n = 0;
     int i;
     for (i = 0; i < 81; i++) {
         n += moves[i];
     }
-    n = rand() % n;
+    n = next_random() % n;
     for (i = 0; i < 81; i++) {
         if (moves[i] && n-- == 0) return i;
     }
     return -1;
 }
 
+/*
+ * check whether move leads to immediate victory
+ */
 int is_winning_move(struct board *b, int move, int player) {
-    return 0;
-	//~""" get move that leads to immediate victory, if any, or None
-	//~"""
-	//~return next((m for m in moves if winning(apply_move(board, m, player), player)), None)
+    struct board b2;
+    copy(b, &b2);
+    apply_move(&b2, move, player);
+    return winning(b2.meta, player);
 }
 
+/*
+ * check whether move does not lead to victory of other player in next turn
+ */
 int is_non_losing_move(struct board *b, int move, int player) {
-    return 0;
-	//~""" get moves that do not lead to victory of other player in next turn
-	//~"""
-	//~return [m for m, nb in ((m, apply_move(board, m, player)) for m in moves)
-	        //~if not winning_move(nb, get_moves(nb, m), -player)]
+    struct board b2;
+    int moves[81], i;
+    copy(b, &b2);
+    apply_move(&b2, move, player);
+    get_moves(&b2, move, moves);
+    for (i = 0; i < 81; i++) {
+        if (moves[i] && is_winning_move(&b2, i, -player)) return 0;
+    }
+    return 1;
 }
 
 /*
  * perform random moves until the game is over,
- * return winning player and number of moves
+ * return winning player and add number of moves to count
  */
-int random_play(struct board *b, int move, int player) {
-    int moves[81];
+int random_play(struct board *b, int move, int player, long *count) {
+    int moves[81], n;
 	apply_move(b, move, player);
     while (1) {
         if (winning(b->meta, player)) {
             return player;
         }
-        get_moves(b, move, moves);
-        if (! contains(moves, 81, 1)) {
+        n = list_moves(b, move, moves);
+        if (n == 0) {
             return winning_draw(b->meta, player);
         }
         
         player = -player;
-        move = random_move(moves);
+        move = moves[next_random() % n];
         apply_move(b, move, player);
+        (*count)++;
     }
 }
 
-void evaluate_moves(struct board *b, int moves[], int player, int scores[]) {
-    int i;
+double now() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+/*
+ * perform random plays for random moves until time is up, add results to
+ * scores and plays per move to plays, return number of plays and add number
+ * of moves to count
+ */
+long evaluate_moves(struct board *b, int moves[], int player, double timeout,
+                    int scores[], int plays[], long *count) {
+    long i;
     struct board b2;
-    for (i = 0; i < 1000; i++) {
+    double start = now();
+    for (i = 0; now() - start < timeout; i++) {
         copy(b, &b2);
         int move = random_move(moves);
-        int win = random_play(&b2, move, player);
+        int win = random_play(&b2, move, player, count);
         scores[move] += player * win;
+        plays[move]++;
     }
-    show_moves(scores);
+    return i;
 }
 
 int best_move_random_plays(struct board *b, int moves[], int player) {
-    int scores[81], i;
-    for (i = 0; i < 81; i++) scores[i] = 0;
-	evaluate_moves(b, moves, player, scores);
-    int best = 0;
-    for (i = 1; i < 81; i++) {
-        if (scores[i] > scores[best]) best = i;
+    int scores[81], plays_per_move[81], i;
+    long count = 0;
+    for (i = 0; i < 81; i++) scores[i] = plays_per_move[i] = 0;
+	long plays = evaluate_moves(b, moves, player, TIMEOUT, scores, plays_per_move, &count);
+    int best = -1;
+    for (i = 0; i < 81; i++) {
+        if (moves[i] && (best == -1 || scores[i] > scores[best])) best = i;
     }
-    printf("move %d; score %d\n", best, scores[best]);
+    printf("plays %ld; moves %ld; move %d; score %d\n", plays, count, best, scores[best]);
     return best;
 }
 
+/*
+ * return winning move, or best non-losing move, if any
+ */
 int best_move(struct board *b, int moves[], int player) {
-    return best_move_random_plays(b, moves, player);
-	//~""" return winning move, or best non-losing move, if any
-	//~"""
-	//~win_move = winning_move(board, moves, player)
-	//~non_lose = non_losing_moves(board, moves, player)
-	//~if win_move:
-		//~return 999, win_move
-	//~elif non_lose:
-		//~return best_move_random_plays(board, non_lose, player)
-	//~else:
-		//~return best_move_random_plays(board, moves, player)
+    int non_lose[81], i, any_non_lose = 0;
+    for (i = 0; i < 81; i++) {
+        if (moves[i] && is_winning_move(b, i, player)) return i;
+    }
+    for (i = 0; i < 81; i++) {
+        non_lose[i] = moves[i] && is_non_losing_move(b, i, player);
+        any_non_lose |= non_lose[i];
+    }
+    return best_move_random_plays(b, any_non_lose ? non_lose : moves, player);
+}
+
+/*
+ * PYTHON INTERFACE
+ * board given as meta board (9) and flattened fields (9x9), moves as flags
+ * indexed by x*9+y, as used by uttt.py; scores and number of plays for those
+ * moves are added to the scores and plays arrays, and total number of plays
+ * and moves written to stats
+ */
+
+void uttt_seed(unsigned int seed) {
+    rng_state = seed ? seed : 2463534242u;
+}
+
+void uttt_evaluate_moves(int meta[], int field[], int moves[], int player, double timeout,
+                         int scores[], int plays[], long stats[]) {
+    struct board b;
+    int i, k;
+    for (i = 0; i < 9; i++) {
+        b.meta[i] = meta[i];
+        for (k = 0; k < 9; k++) {
+            b.field[i][k] = field[i*9+k];
+        }
+    }
+    stats[1] = 0;
+    stats[0] = evaluate_moves(&b, moves, player, timeout, scores, plays, &stats[1]);
 }
 
 
@@ -240,7 +341,7 @@ int best_move(struct board *b, int moves[], int player) {
 
 int play_game() {
 	struct board *b = init_board();
-    int player = rand() % 2 ? 1 : -1;
+    int player = next_random() % 2 ? 1 : -1;
     int move = -1;
     int moves[81];
     int turn = 0;
@@ -292,7 +393,8 @@ void test_board() {
 }
 
 int main() {
-    
+    uttt_seed(time(NULL));
+
     //~test_board();
     
     play_game();
@@ -5,7 +5,8 @@ Idea and basic algorithm from my CodinGame bot. Some adaptions, simplifications
 and extensions for game with UI and multiple players.
 """
 
-import sys, functools, random, time, copy, itertools
+import sys, os, functools, random, time, copy, itertools, math
+import collections, concurrent.futures, ctypes, mmap, multiprocessing.util, struct
 
 
 debug = functools.partial(print, file=sys.stderr)
@@ -13,6 +14,40 @@ rows = range(3) # yes, this does makes a difference!
 
 SYMBOL = [".", "X", "#", "O"]
 NONE, OWN, OPP, DRAW = 0, 1, -1, 2
+TIMEOUT = 0.5
+
+
+# LOOKUP TABLES
+# a 3x3 board is a 9-bit mask per player, bit r*3+c for cell (r, c)
+
+BIT = [1 << i for i in range(9)]
+FULL = 0b111111111
+LINES = [sum(BIT[i] for i in line) for line in
+         [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6),
+          (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]]
+WIN = [any(mask & line == line for line in LINES) for mask in range(512)]
+FREE = [tuple(i for i in range(9) if not mask & BIT[i]) for mask in range(512)]
+COUNT = [bin(mask).count("1") for mask in range(512)]
+
+
+# C PLAYOUT ENGINE
+# optional, compile with: gcc -O3 -shared -fPIC -o libuttt.so uttt.c
+
+def load_engine(path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "libuttt.so")):
+	""" load compiled playout engine, or None if not available
+	"""
+	try:
+		lib = ctypes.CDLL(path)
+	except OSError:
+		return None
+	lib.uttt_seed.argtypes = [ctypes.c_uint]
+	lib.uttt_seed.restype = None
+	lib.uttt_evaluate_moves.argtypes = [ctypes.POINTER(ctypes.c_int)] * 3 + \
+			[ctypes.c_int, ctypes.c_double] + [ctypes.POINTER(ctypes.c_int)] * 2 + [ctypes.POINTER(ctypes.c_long)]
+	lib.uttt_evaluate_moves.restype = None
+	return lib
+
+_lib = load_engine()
 
 
 # BASIC BOARD HANDLING
@@ -40,10 +75,7 @@ def winning_draw(board, player):
 def winning(board, player):
 	""" check whether player has won the board, works for sub- or for meta board
 	"""
-	return (any(all(board[r*3+c] == player for c in rows) for r in rows)
-		 or any(all(board[r*3+c] == player for r in rows) for c in rows)
-		 or all(board[i*3+   i]  == player for i in rows)
-		 or all(board[i*3+2-i]  == player for i in rows))
+	return WIN[sum(BIT[i] for i, c in enumerate(board) if c == player)]
 
 def apply_move(board, move, player):
 	""" apply move; if player won smaller board, update meta board
@@ -61,6 +93,88 @@ def apply_move(board, move, player):
 		board[R*3+C] = DRAW
 	return board
 	
+def to_bitboard(board):
+	""" convert nested-list board to bitboard: list of 9 sub-board masks for
+	each player, meta masks for each player, and mask of closed sub-boards
+	"""
+	masks = {+1: [0] * 9, -1: [0] * 9}
+	meta = {+1: 0, -1: 0}
+	closed = 0
+	for i, sub in enumerate(board):
+		if type(sub) == list:
+			for k, c in enumerate(sub):
+				if c in masks:
+					masks[c][i] |= BIT[k]
+		else:
+			closed |= BIT[i]
+			if sub in meta:
+				meta[sub] |= BIT[i]
+	return masks[+1], masks[-1], meta[+1], meta[-1], closed
+
+def bitboard_moves(bb, last):
+	""" get valid moves as (sub-board, cell) index pairs given bitboard and
+	index pair of last move, or None
+	"""
+	xs, ys, _, _, closed = bb
+	if last is not None and not closed & BIT[last[1]]:
+		b = last[1]
+		return [(b, k) for k in FREE[xs[b] | ys[b]]]
+	return [(b, k) for b in range(9) if not closed & BIT[b]
+	               for k in FREE[xs[b] | ys[b]]]
+
+def to_index(move):
+	""" convert (x, y) move to (sub-board, cell) index pair
+	"""
+	return (move[0] // 3) * 3 + move[1] // 3, (move[0] % 3) * 3 + move[1] % 3
+
+def to_move(b, k):
+	""" convert (sub-board, cell) index pair to (x, y) move
+	"""
+	return 3 * (b // 3) + k // 3, 3 * (b % 3) + k % 3
+
+def copy_bitboard(bb):
+	""" copy bitboard, i.e. the mutable mask lists
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	return xs[:], ys[:], meta_x, meta_o, closed
+
+def bitboard_apply(bb, index, player):
+	""" apply move for player on bitboard; modifies the mask lists in place
+	and returns the bitboard with updated meta and closed masks
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	b, k = index
+	masks = xs if player == +1 else ys
+	m = masks[b] | BIT[k]
+	masks[b] = m
+	if WIN[m]:
+		closed |= BIT[b]
+		if player == +1:
+			meta_x |= BIT[b]
+		else:
+			meta_o |= BIT[b]
+	elif xs[b] | ys[b] == FULL:
+		closed |= BIT[b]
+	return xs, ys, meta_x, meta_o, closed
+
+def bitboard_normalized(bb):
+	""" copy of bitboard with the cell masks of closed sub-boards cleared, as
+	in bitboards created by to_bitboard, so that positions can be compared
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	return ([0 if closed & BIT[b] else m for b, m in enumerate(xs)],
+	        [0 if closed & BIT[b] else m for b, m in enumerate(ys)], meta_x, meta_o, closed)
+
+def bitboard_result(bb, player):
+	""" get winner if the game is over after player's move, otherwise None
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	if WIN[meta_x if player == +1 else meta_o]:
+		return player
+	if closed == FULL:
+		return winning_draw_masks(meta_x, meta_o, +1)
+	return None
+
 def show_grid(board):
 	""" draw a nice representation of the grid; mainly to check apply_move
 	"""
@@ -77,102 +191,783 @@ def show_grid(board):
 		debug(' '.join(line))
 
 
+# TRANSPOSITION TABLE
+# positions hashed with Zobrist keys, entries evicted least-recently-used
+
+TT_SIZE = 1 << 18
+UNKNOWN = object()
+
+_zobrist = random.Random(0)
+Z_CELL = [[[_zobrist.getrandbits(64) for k in range(9)] for b in range(9)] for p in (0, 1)]
+Z_SUB = [[[functools.reduce(int.__xor__, (Z_CELL[p][b][k] for k in range(9) if mask & BIT[k]), 0)
+           for mask in range(512)] for b in range(9)] for p in (0, 1)]
+Z_CLOSED = [[_zobrist.getrandbits(64) for state in range(3)] for b in range(9)]
+Z_TARGET = [_zobrist.getrandbits(64) for k in range(10)]
+Z_PLAYER = {+1: 0, -1: _zobrist.getrandbits(64)}
+
+def zobrist(bb, last, player):
+	""" hash of bitboard, index pair of last move, or None, and player to move;
+	cells of closed sub-boards are not included, just who closed them, and the
+	last move only by the sub-board it sends the player to
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	free = last is None or closed & BIT[last[1]]
+	h = Z_PLAYER[player] ^ Z_TARGET[9 if free else last[1]]
+	for b in range(9):
+		if closed & BIT[b]:
+			h ^= Z_CLOSED[b][1 if meta_x & BIT[b] else 2 if meta_o & BIT[b] else 0]
+		else:
+			h ^= Z_SUB[0][b][xs[b]] ^ Z_SUB[1][b][ys[b]]
+	return h
+
+class Entry:
+	""" transposition table entry, holding the winner if the game is over, the
+	winning move for the player to move, if already known, and the sum of
+	winners and number of random plays through the position; valid moves are
+	not kept, as they would take up most of the memory of the table
+	"""
+	__slots__ = ("result", "win", "score", "plays")
+
+	def __init__(self, result):
+		self.result = result
+		self.win = UNKNOWN
+		self.score = 0
+		self.plays = 0
+
+class TranspositionTable:
+	""" bounded mapping from position hashes to entries, evicting the least
+	recently used entry when full, and counting hits and misses
+	"""
+
+	def __init__(self, size=TT_SIZE):
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.hits = self.misses = 0
+
+	def get(self, key):
+		entry = self.entries.get(key)
+		if entry is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+			self.entries.move_to_end(key)
+		return entry
+
+	def put(self, key, entry):
+		self.entries[key] = entry
+		if len(self.entries) > self.size:
+			self.entries.popitem(last=False)
+
+	def hit_rate(self):
+		return self.hits / max(1, self.hits + self.misses)
+
+	def __str__(self):
+		return "TT: %d/%d entries, %d hits, %d misses, hit rate %.3f" % (
+				len(self.entries), self.size, self.hits, self.misses, self.hit_rate())
+
+TT = TranspositionTable()
+
+def lookup(bb, last, player):
+	""" get entry for position, creating it if not in the table
+	"""
+	key = zobrist(bb, last, player)
+	entry = TT.get(key)
+	if entry is None:
+		result = bitboard_result(bb, -player) if last is not None else None
+		entry = Entry(result)
+		TT.put(key, entry)
+	return entry
+
+def bitboard_winning_move(bb, last, player):
+	""" get index pair of move leading to immediate victory, if any, or None,
+	cached in the transposition table
+	"""
+	entry = lookup(bb, last, player)
+	if entry.win is UNKNOWN:
+		meta = 2 if player == +1 else 3
+		moves = bitboard_moves(bb, last) if entry.result is None else []
+		entry.win = next((i for i in moves
+				if WIN[bitboard_apply(copy_bitboard(bb), i, player)[meta]]), None)
+	return entry.win
+
+def record_plays(board, moves, player, scores, plays):
+	""" add results and number of random plays per move to the entries of the
+	positions after those moves
+	"""
+	bb = to_bitboard(board)
+	for m in moves:
+		if plays[m]:
+			i = to_index(m)
+			entry = lookup(bitboard_apply(copy_bitboard(bb), i, player), i, -player)
+			entry.score += player * scores[m]
+			entry.plays += plays[m]
+
+def accumulated_scores(board, moves, player):
+	""" get average result of all recorded random plays per move
+	"""
+	bb = to_bitboard(board)
+	result = {}
+	for m in moves:
+		i = to_index(m)
+		entry = lookup(bitboard_apply(copy_bitboard(bb), i, player), i, -player)
+		result[m] = player * entry.score / max(1, entry.plays)
+	return result
+
+
 # STRATEGY
 # stuff related to which moves to take, independent of board data structure
 
+# number of random plays and moves performed so far, for measuring performance
+COUNTERS = collections.Counter()
+
 def winning_move(board, moves, player):
 	""" get move that leads to immediate victory, if any, or None
 	"""
-	return next((m for m in moves if winning(apply_move(board, m, player), player)), None)
+	bb = to_bitboard(board)
+	meta = 2 if player == +1 else 3
+	return next((m for m in moves if WIN[bitboard_apply(copy_bitboard(bb), to_index(m), player)[meta]]), None)
 
 def non_losing_moves(board, moves, player):
 	""" get moves that do not lead to victory of other player in next turn
 	"""
-	return [m for m, nb in ((m, apply_move(board, m, player)) for m in moves)
-	        if not winning_move(nb, get_moves(nb, m), -player)]
+	bb = to_bitboard(board)
+	return [m for m, i in ((m, to_index(m)) for m in moves)
+	        if bitboard_winning_move(bitboard_apply(copy_bitboard(bb), i, player), i, -player) is None]
 
 def random_play(board, move, player):
 	""" perform random moves until the game is over,
 	return winning player and number of moves
 	"""
-	board = apply_move(board, move, player)
+	return bitboard_random_play(to_bitboard(board), to_index(move), player)
+
+class MoveSet:
+	""" free cells in open sub-boards as cell numbers b*9+k, in a list with
+	the position of each cell, so that bitboard_random_play can remove cells
+	and pick a random cell in O(1); build once per position and copy for
+	each playout
+	"""
+	__slots__ = ("cells", "pos")
+
+	def __init__(self, bb=None):
+		self.cells, self.pos = [], [-1] * 81
+		if bb is not None:
+			xs, ys, _, _, closed = bb
+			for b in range(9):
+				if not closed & BIT[b]:
+					for k in FREE[xs[b] | ys[b]]:
+						self.pos[b*9+k] = len(self.cells)
+						self.cells.append(b*9+k)
+
+	def copy(self):
+		other = MoveSet()
+		other.cells, other.pos = self.cells[:], self.pos[:]
+		return other
+
+CELL = [divmod(c, 9) for c in range(81)]
+
+def bitboard_random_play(bb, index, player, free_cells=None):
+	""" perform random moves on a bitboard until the game is over, starting by
+	player playing the given (sub-board, cell) index pair; modifies the masks
+	and the given move set (created if None) in place, return winning player
+	and number of moves
+	"""
+	own, opp, meta_own, meta_opp, closed = bb
+	if player != +1:
+		own, opp, meta_own, meta_opp = opp, own, meta_opp, meta_own
+	if free_cells is None:
+		free_cells = MoveSet(bb)
+	cells, pos = free_cells.cells, free_cells.pos
+	b, k = index
+	rnd = random.random
 	for i in itertools.count():
-		if winning(board, player):
-			return player, i
-		moves = get_moves(board, move)
-		if not moves:
-			return winning_draw(board, player), i
+		# apply move for player owning "own" masks, remove cell from move set
+		bit = BIT[b]
+		m = own[b] | BIT[k]
+		own[b] = m
+		c = b*9+k
+		j, last = pos[c], cells.pop()
+		if last != c:
+			cells[j] = last
+			pos[last] = j
+		if WIN[m] or m | opp[b] == FULL:
+			closed |= bit
+			if WIN[m]:
+				meta_own |= bit
+				if WIN[meta_own]:
+					return player, i
+			for f in FREE[m | opp[b]]:
+				c = b*9+f
+				j, last = pos[c], cells.pop()
+				if last != c:
+					cells[j] = last
+					pos[last] = j
+		# select random move for other player
+		if closed & BIT[k]:
+			if not cells:
+				return winning_draw_masks(meta_own, meta_opp, player), i
+			b, k = CELL[cells[int(rnd() * len(cells))]]
+		else:
+			b = k
+			free = FREE[own[b] | opp[b]]
+			k = free[int(rnd() * len(free))]
+		own, opp, meta_own, meta_opp = opp, own, meta_opp, meta_own
 		player = -player
-		move = random.choice(moves)
-		board = apply_move(board, move, player)
+
+def winning_draw_masks(meta_own, meta_opp, player):
+	""" winning draw for meta masks of player and opponent
+	"""
+	own, opp = COUNT[meta_own], COUNT[meta_opp]
+	return player if (own > opp) else (-player if opp > own else 0)
 
 def evaluate_moves(board, moves, player, timeout):
-	""" perform random plays for random moves until time is up,
+	""" perform random plays for random moves until time is up, using the
+	C engine if available
 	"""
-	scores = {move: 0 for move in moves}
+	if _lib is not None:
+		return evaluate_moves_c(board, moves, player, timeout)
 	start = time.time()
-	total = 0
-	for i in itertools.count():
-		if time.time() - start > timeout:
-			break
-		move = random.choice(moves)
-		r, c = random_play(board, move, player)
-		scores[move] += player * r
-		total += c
+	scores, plays, i, total = playouts(board, moves, player, lambda i: time.time() - start <= timeout)
 	debug(i, total, scores)
+	COUNTERS.update(plays=i, moves=total)
+	record_plays(board, moves, player, scores, plays)
+	return scores
+
+def playouts(board, moves, player, more):
+	""" perform random plays for random moves as long as more(number of plays
+	so far) is true; return scores, number of plays per move, total number of
+	plays and total number of moves
+	"""
+	scores = {move: 0 for move in moves}
+	plays = {move: 0 for move in moves}
+	bb = to_bitboard(board)
+	free_cells = MoveSet(bb)
+	indices = [to_index(m) for m in moves]
+	i = total = 0
+	while more(i):
+		n = random.randrange(len(moves))
+		r, c = bitboard_random_play(copy_bitboard(bb), indices[n], player, free_cells.copy())
+		scores[moves[n]] += player * r
+		plays[moves[n]] += 1
+		total += c
+		i += 1
+	return scores, plays, i, total
+
+def evaluate_moves_c(board, moves, player, timeout):
+	""" perform random plays for random moves until time is up in C engine
+	"""
+	meta = (ctypes.c_int * 9)()
+	field = (ctypes.c_int * 81)()
+	flags = (ctypes.c_int * 81)()
+	scores = (ctypes.c_int * 81)()
+	plays = (ctypes.c_int * 81)()
+	stats = (ctypes.c_long * 2)()
+	for i, sub in enumerate(board):
+		if type(sub) == list:
+			field[i*9:i*9+9] = sub
+		else:
+			meta[i] = sub
+	for x, y in moves:
+		flags[x*9+y] = 1
+	_lib.uttt_seed(random.getrandbits(32))
+	_lib.uttt_evaluate_moves(meta, field, flags, player, timeout, scores, plays, stats)
+	plays = {(x, y): plays[x*9+y] for x, y in moves}
+	scores = {(x, y): scores[x*9+y] for x, y in moves}
+	debug(stats[0], stats[1], scores)
+	COUNTERS.update(plays=stats[0], moves=stats[1])
+	record_plays(board, moves, player, scores, plays)
 	return scores
 
 def best_move_random_plays(board, moves, player):
-	""" select move with best win/loss ratio
+	""" select move with best win/loss ratio over all random plays so far
+	"""
+	evaluate_moves(board, moves, player, TIMEOUT)
+	scores = accumulated_scores(board, moves, player)
+	return max((scores[m], m) for m in moves)
+
+
+# PARALLEL RANDOM PLAYS
+# root-parallel random plays in persistent worker processes, merged per move
+
+WORKERS = os.cpu_count() or 1
+BATCH_SIZE = 100
+_pool = None
+
+def get_pool(workers=None):
+	""" get persistent pool of worker processes, re-created if the number of
+	workers changed
+	"""
+	global _pool
+	workers = workers or WORKERS
+	if _pool is None or _pool[0] != workers:
+		if _pool is not None:
+			_pool[1].shutdown()
+		else:
+			# high priority, so it runs before the queues of the pool are closed
+			multiprocessing.util.Finalize(None, shutdown_pool, exitpriority=100)
+		_pool = workers, concurrent.futures.ProcessPoolExecutor(workers)
+	return _pool[1]
+
+def shutdown_pool():
+	""" shut down the persistent pool of worker processes, if any; called on
+	exit before waiting for child processes, so that worker processes of e.g.
+	a tournament, that have a pool of their own, can exit
+	"""
+	global _pool
+	if _pool is not None:
+		_pool[1].shutdown()
+		_pool = None
+
+def playout_batch(board, moves, player, n, seed):
+	""" perform n random plays for random moves, using the given seed;
+	return scores, number of plays per move and total number of moves
+	"""
+	random.seed(seed)
+	scores, plays, _, total = playouts(board, moves, player, lambda i: i < n)
+	return scores, plays, total
+
+def evaluate_moves_parallel(board, moves, player, timeout, workers=None, seed=None, playouts=None):
+	""" perform random plays in batches in worker processes until time is up,
+	or until the given number of playouts is reached; each batch has its own
+	seed drawn from the master seed, so the merged scores only depend on the
+	seed and the number of batches, and are reproducible if playouts is given
+	"""
+	workers = workers or WORKERS
+	pool = get_pool(workers)
+	master = random.Random(seed)
+	scores = {move: 0 for move in moves}
+	plays = {move: 0 for move in moves}
+	start = time.time()
+	pending, batches, total = set(), 0, 0
+
+	def more():
+		if playouts is not None:
+			return batches * BATCH_SIZE < playouts
+		return time.time() - start < timeout
+
+	while more() and len(pending) < workers:
+		pending.add(pool.submit(playout_batch, board, moves, player, BATCH_SIZE, master.getrandbits(64)))
+		batches += 1
+	while pending:
+		done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+		for future in done:
+			batch_scores, batch_plays, c = future.result()
+			for m in batch_scores:
+				scores[m] += batch_scores[m]
+				plays[m] += batch_plays[m]
+			total += c
+			if more():
+				pending.add(pool.submit(playout_batch, board, moves, player, BATCH_SIZE, master.getrandbits(64)))
+				batches += 1
+	debug(batches * BATCH_SIZE, total, scores)
+	COUNTERS.update(plays=batches * BATCH_SIZE, moves=total)
+	record_plays(board, moves, player, scores, plays)
+	return scores
+
+def best_move_parallel_plays(board, moves, player):
+	""" select move with best win/loss ratio over all random plays so far,
+	using parallel random plays
 	"""
-	scores = evaluate_moves(board, moves, player, TIMEOUT)
+	evaluate_moves_parallel(board, moves, player, TIMEOUT, seed=random.getrandbits(64))
+	scores = accumulated_scores(board, moves, player)
 	return max((scores[m], m) for m in moves)
 
-def best_move(board, moves, player):
-	""" return winning move, or best non-losing move, if any
+# MONTE CARLO TREE SEARCH
+# UCT search on bitboards, with a tree that is kept and re-rooted between turns
+
+UCT_C = 1.4
+NODE_BUDGET = 250000
+
+class Node:
+	""" node in the search tree, holding the move leading to it, the player who
+	made that move, expanded children, untried moves, and win/visit statistics
+	"""
+	__slots__ = ("move", "player", "children", "untried", "wins", "visits")
+
+	def __init__(self, move, player):
+		self.move = move
+		self.player = player
+		self.children = []
+		self.untried = None
+		self.wins = 0.0
+		self.visits = 0
+
+	def size(self):
+		""" number of nodes in the subtree rooted at this node
+		"""
+		return 1 + sum(c.size() for c in self.children)
+
+class MCTSTree:
+	""" search tree persisting between turns; when asked for a new position, the
+	matching child or grandchild of the previous root becomes the new root and
+	the rest of the tree is dropped; no new nodes are expanded beyond the budget
+	"""
+
+	def __init__(self, budget=NODE_BUDGET):
+		self.budget = budget
+		self.root = None
+		self.bb = None
+		self.nodes = 0
+
+	def set_root(self, board, moves, player):
+		""" re-root tree at given position, reusing the matching subtree, if
+		any, and pruning root moves not in the given moves
+		"""
+		bb = to_bitboard(board)
+		indices = [to_index(m) for m in moves]
+		root = self.find(bb, player)
+		if root is None:
+			root = Node(None, -player)
+		allowed = set(indices)
+		root.children = [c for c in root.children if c.move in allowed]
+		expanded = set(c.move for c in root.children)
+		root.untried = [i for i in indices if i not in expanded]
+		random.shuffle(root.untried)
+		self.root, self.bb = root, bb
+		self.nodes = root.size()
+
+	def find(self, bb, player):
+		""" find node for position in root, its children or grandchildren;
+		the bitboards are compared with the cells of closed sub-boards cleared
+		"""
+		if self.root is None:
+			return None
+		if self.root.player == -player and self.bb == bb:
+			return self.root
+		for child in self.root.children:
+			bb1 = bitboard_apply(copy_bitboard(self.bb), child.move, child.player)
+			if child.player == -player and bitboard_normalized(bb1) == bb:
+				return child
+			for grandchild in child.children:
+				bb2 = bitboard_apply(copy_bitboard(bb1), grandchild.move, grandchild.player)
+				if grandchild.player == -player and bitboard_normalized(bb2) == bb:
+					return grandchild
+		return None
+
+	def search(self, timeout):
+		""" run iterations until time is up, return number of iterations
+		"""
+		start = time.time()
+		for i in itertools.count():
+			if i and time.time() - start > timeout:
+				return i
+			self.iterate()
+
+	def iterate(self):
+		""" one iteration of selection, expansion, random playout and
+		back-propagation
+		"""
+		node, bb = self.root, copy_bitboard(self.bb)
+		path = [node]
+		result = None
+		# selection
+		while not node.untried and node.children:
+			log_n = math.log(node.visits)
+			node = max(node.children, key=lambda c: c.wins / c.visits
+			           + UCT_C * math.sqrt(log_n / c.visits))
+			bb = bitboard_apply(bb, node.move, node.player)
+			path.append(node)
+			result = bitboard_result(bb, node.player)
+			if result is not None:
+				break
+			if node.untried is None:
+				node.untried = bitboard_moves(bb, node.move)
+				random.shuffle(node.untried)
+		# expansion and simulation
+		if result is None:
+			if self.nodes < self.budget:
+				node.children.append(Node(node.untried.pop(), -node.player))
+				self.nodes += 1
+				node = node.children[-1]
+				path.append(node)
+				result, _ = bitboard_random_play(bb, node.move, node.player)
+			else:
+				move = random.choice(node.untried)
+				result, _ = bitboard_random_play(bb, move, -node.player)
+		# back-propagation
+		for n in path:
+			n.visits += 1
+			if result == n.player:
+				n.wins += 1
+			elif result == 0:
+				n.wins += 0.5
+
+MCTS_TREES = {}
+
+def best_move_mcts(board, moves, player):
+	""" select most visited move after searching the persistent MCTS tree
+	of the given player
+	"""
+	tree = MCTS_TREES.setdefault(player, MCTSTree())
+	tree.set_root(board, moves, player)
+	n = tree.search(TIMEOUT)
+	best = max(tree.root.children, key=lambda c: c.visits)
+	debug(n, tree.nodes, best.visits, best.wins)
+	COUNTERS.update(plays=n)
+	return best.wins / best.visits, to_move(*best.move)
+
+
+# ALPHA-BETA SEARCH
+# iterative deepening negamax on bitboards with a static evaluation function
+
+WIN_SCORE = 100000
+MAX_DEPTH = 30
+META_WEIGHT = [3, 2, 3, 2, 4, 2, 3, 2, 3]  # value of won sub-board by position
+LINE_WEIGHT = [1, 10, 100, 0]              # value of open meta line by won sub-boards
+THREAT_WEIGHT = 2                          # value of two-in-a-line in sub-board
+
+# for each mask, the cells needed to complete lines with two cells in the mask
+THREATS = [[line & ~mask for line in LINES if COUNT[line & mask] == 2] for mask in range(512)]
+
+def threats(own, opp):
+	""" number of lines in a sub-board the player can complete with one move
+	"""
+	return sum(1 for cell in THREATS[own] if not cell & opp)
+
+def evaluate(bb, player):
+	""" static evaluation from the perspective of player: won sub-boards,
+	meta lines still open for each player, and threats in open sub-boards
+	"""
+	xs, ys, meta_x, meta_o, closed = bb
+	blocked_x, blocked_o = closed & ~meta_x, closed & ~meta_o
+	score = 0
+	for line in LINES:
+		if not line & blocked_x:
+			score += LINE_WEIGHT[COUNT[line & meta_x]]
+		if not line & blocked_o:
+			score -= LINE_WEIGHT[COUNT[line & meta_o]]
+	for b in range(9):
+		if meta_x & BIT[b]:
+			score += META_WEIGHT[b] * 10
+		elif meta_o & BIT[b]:
+			score -= META_WEIGHT[b] * 10
+		elif not closed & BIT[b]:
+			score += THREAT_WEIGHT * META_WEIGHT[b] * (threats(xs[b], ys[b]) - threats(ys[b], xs[b]))
+	return score if player == +1 else -score
+
+class SearchTimeout(Exception):
+	""" raised when the deadline of the search is reached
+	"""
+
+class AlphaBeta:
+	""" negamax search with alpha-beta pruning, ordering moves by killer moves
+	(per ply) and history heuristic; stops at the given deadline
+	"""
+
+	def __init__(self, deadline):
+		self.deadline = deadline
+		self.killers = [[] for _ in range(MAX_DEPTH + 1)]
+		self.history = [0] * 81
+		self.nodes = 0
+
+	def order(self, moves, ply):
+		""" order moves: killer moves first, then by history score
+		"""
+		killers = self.killers[ply]
+		history = self.history
+		return sorted(moves, key=lambda i: (i not in killers, -history[i[0] * 9 + i[1]]))
+
+	def cutoff(self, move, ply, depth):
+		""" remember move causing a beta cutoff
+		"""
+		killers = self.killers[ply]
+		if move not in killers:
+			killers.insert(0, move)
+			del killers[2:]
+		self.history[move[0] * 9 + move[1]] += depth * depth
+
+	def search(self, bb, moves, player, depth, alpha, beta, ply):
+		""" return negamax score and best move for player to move
+		"""
+		self.nodes += 1
+		best, best_move = -WIN_SCORE - 1, None
+		for i in (moves if ply == 0 else self.order(moves, ply)):
+			if time.time() >= self.deadline:
+				raise SearchTimeout()
+			child = bitboard_apply(copy_bitboard(bb), i, player)
+			result = bitboard_result(child, player)
+			if result is not None:
+				score = result * player * (WIN_SCORE - ply)
+			elif depth <= 1:
+				score = evaluate(child, player)
+			else:
+				score = -self.search(child, bitboard_moves(child, i), -player,
+				                     depth - 1, -beta, -alpha, ply + 1)[0]
+			if score > best:
+				best, best_move = score, i
+			alpha = max(alpha, score)
+			if alpha >= beta:
+				self.cutoff(i, ply, depth)
+				break
+		return best, best_move
+
+def best_move_alphabeta(board, moves, player, timeout=None, max_depth=MAX_DEPTH):
+	""" select move by iterative deepening alpha-beta search until time is up;
+	return score and best move of the deepest completed search
+	"""
+	ab = AlphaBeta(time.time() + (timeout or TIMEOUT))
+	bb = to_bitboard(board)
+	indices = [to_index(m) for m in moves]
+	score, best = 0, indices[0]
+	for depth in range(1, max_depth + 1):
+		try:
+			ordered = [best] + ab.order([i for i in indices if i != best], 0)
+			score, best = ab.search(bb, ordered, player, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0)
+		except SearchTimeout:
+			break
+		if abs(score) >= WIN_SCORE - MAX_DEPTH:
+			break
+	debug(depth, ab.nodes, score)
+	return score, to_move(*best)
+
+
+# OPENING BOOK
+# precomputed moves for early positions, see uttt_book.py for creating it;
+# positions are reduced by the 8 symmetries of the board and by swapping colors
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uttt_book.bin")
+BOOK_HEADER = struct.Struct("<8sII")  # magic, depth, number of records
+BOOK_RECORD = struct.Struct("<QfB")   # position key, score, move as b*9+k
+BOOK_MAGIC = b"UTTTBOOK"
+
+# the symmetries permute sub-boards and the cells within in the same way
+SYMMETRIES = [[f(r, c) for r in rows for c in rows] for f in (
+		lambda r, c: r*3 + c,     lambda r, c: c*3 + 2-r,
+		lambda r, c: (2-r)*3 + 2-c, lambda r, c: (2-c)*3 + r,
+		lambda r, c: c*3 + r,     lambda r, c: r*3 + 2-c,
+		lambda r, c: (2-c)*3 + 2-r, lambda r, c: (2-r)*3 + c)]
+INVERSE = [[p.index(i) for i in range(9)] for p in SYMMETRIES]
+SYM_MASK = [[sum(BIT[p[i]] for i in range(9) if mask & BIT[i]) for mask in range(512)]
+            for p in SYMMETRIES]
+
+def transform(bb, s):
+	""" apply symmetry s to bitboard
+	"""
+	p, pm = SYMMETRIES[s], SYM_MASK[s]
+	xs, ys, meta_x, meta_o, closed = bb
+	xs2, ys2 = [0] * 9, [0] * 9
+	for b in range(9):
+		xs2[p[b]], ys2[p[b]] = pm[xs[b]], pm[ys[b]]
+	return xs2, ys2, pm[meta_x], pm[meta_o], pm[closed]
+
+def book_key(bb, target, player):
+	""" canonical key of position, given the sub-board to play in, or None,
+	and the player to move, and the symmetry leading to that key
+	"""
+	if player != +1:
+		xs, ys, meta_x, meta_o, closed = bb
+		bb = ys, xs, meta_o, meta_x, closed
+	return min((zobrist(transform(bb, s), None if target is None else (None, SYMMETRIES[s][target]), +1), s)
+	           for s in range(8))
+
+class Book:
+	""" opening book in a memory-mapped file, records sorted by key
+	"""
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self.depth, self.size = BOOK_HEADER.unpack_from(self.data, 0)
+		if magic != BOOK_MAGIC:
+			raise ValueError("not an opening book: %s" % path)
+
+	def get(self, key):
+		""" get score and move for key by binary search, or None
+		"""
+		lo, hi = 0, self.size
+		while lo < hi:
+			mid = (lo + hi) // 2
+			k, score, cell = BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + mid * BOOK_RECORD.size)
+			if k == key:
+				return score, cell
+			if k < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return None
+
+def load_book(path=BOOK_FILE):
+	""" load opening book, or None if not available
 	"""
+	try:
+		return Book(path)
+	except (OSError, ValueError):
+		return None
+
+BOOK = load_book()
+
+def position_key(board, moves, player):
+	""" canonical key of position with given valid moves, and the symmetry
+	leading to that key
+	"""
+	targets = set((x // 3) * 3 + y // 3 for x, y in moves)
+	return book_key(to_bitboard(board), targets.pop() if len(targets) == 1 else None, player)
+
+def book_move(board, moves, player):
+	""" get score and move from opening book, if the position is in it
+	"""
+	if BOOK is None:
+		return None
+	key, s = position_key(board, moves, player)
+	found = BOOK.get(key)
+	if found is not None:
+		score, cell = found
+		move = to_move(INVERSE[s][cell // 9], INVERSE[s][cell % 9])
+		if move in moves:
+			return score, move
+	return None
+
+STRATEGIES = {"random": best_move_random_plays, "parallel": best_move_parallel_plays,
+              "mcts": best_move_mcts, "alphabeta": best_move_alphabeta}
+
+def best_move(board, moves, player, strategy=best_move_random_plays):
+	""" return move from opening book, winning move, or best non-losing move,
+	if any
+	"""
+	book = book_move(board, moves, player)
+	if book:
+		return book
 	win_move = winning_move(board, moves, player)
 	non_lose = non_losing_moves(board, moves, player)
 	if win_move:
 		return 999, win_move
 	elif non_lose:
-		return best_move_random_plays(board, non_lose, player)
+		return strategy(board, non_lose, player)
 	else:
-		return best_move_random_plays(board, moves, player)
+		return strategy(board, moves, player)
 
 
 # TESTING AND PERFORMANCE
 
-def play_game():
+def play_game(strategies=None, player=None, verbose=True):
+	""" play one game, with a strategy for each player, starting with the given
+	or a random player; return the winner
+	"""
+	strategies = strategies or {OWN: best_move_random_plays, OPP: best_move_random_plays}
 	board = init_board()
-	player, move = random.choice([OWN, OPP]), (-1, -1)
+	player, move = player or random.choice([OWN, OPP]), (-1, -1)
 	for i in itertools.count():
 		moves = get_moves(board, move)
 		if not moves:
 			return winning_draw(board, player)
 
-		score, move = best_move(board, moves, player)
+		score, move = best_move(board, moves, player, strategies[player])
 		
-		debug("{} move: {}, score: {}".format(i, move, score))
 		board = apply_move(board, move, player)
 
-		show_grid(board)
+		if verbose:
+			debug("{} move: {}, score: {}".format(i, move, score))
+			show_grid(board)
 		
 		if winning(board, player):
 			return player
 		player = -player
 
 if __name__ == "__main__":
+	# play a single game, showing each move; use uttt_tournament.py for more
 	seed = random.randrange(1000000)
 	random.seed(seed)
-	TIMEOUT = 0.5
-	results = {+1: 0, 0: 0, -1: 0}
-	for i in range(100):
-		r = play_game()
-		results[r] += 1
-		print(i, r, results)
-		break
-	print(results)
+	print(play_game())
+	print(TT)
 	print(seed)
 
 # WHY ARE RESULTS STILL BIASED TOWARDS PLAYER +1 ?
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Ultimate Tic Tac Toe Opening Book
+
+Precompute the best move for all positions with less than a given number of
+moves played, using one of the strategies from uttt.STRATEGIES, and write them
+to a binary file that is memory-mapped by uttt.py and consulted by best_move.
+Positions are reduced by the 8 symmetries of the board and by swapping colors,
+and evaluated in parallel worker processes.
+"""
+
+import concurrent.futures, os
+import uttt
+
+
+def init_worker(timeout):
+	""" initialize worker process: set timeout, suppress debug output, and do
+	not use an existing book
+	"""
+	uttt.TIMEOUT = timeout
+	uttt.BOOK = None
+	uttt.debug = lambda *args, **kwargs: None
+
+def positions(depth):
+	""" get all positions with less than depth moves played, one for each
+	class of symmetric positions, as dict of key to board, moves, player and
+	symmetry
+	"""
+	found = {}
+	level, player = [(uttt.init_board(), (-1, -1))], uttt.OWN
+	for _ in range(depth):
+		next_level = []
+		for board, last in level:
+			moves = uttt.get_moves(board, last)
+			key, s = uttt.position_key(board, moves, player)
+			if key not in found and moves and not uttt.winning(board, -player):
+				found[key] = board, moves, player, s
+				next_level.extend((uttt.apply_move(board, m, player), m) for m in moves)
+		level, player = next_level, -player
+	return found
+
+def evaluate(board, moves, player, strategy):
+	""" get score and best move for position in worker process
+	"""
+	return uttt.best_move(board, moves, player, uttt.STRATEGIES[strategy])
+
+def create_book(depth, strategy, timeout, workers=None, path=uttt.BOOK_FILE):
+	""" evaluate all positions up to depth and write book file
+	"""
+	found = positions(depth)
+	print("%d positions" % len(found))
+	records = []
+	with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+	                                            initargs=(timeout,)) as pool:
+		futures = {pool.submit(evaluate, board, moves, player, strategy): key
+		           for key, (board, moves, player, s) in found.items()}
+		for i, future in enumerate(concurrent.futures.as_completed(futures)):
+			key = futures[future]
+			s = found[key][3]
+			score, move = future.result()
+			b, k = uttt.to_index(move)
+			records.append((key, score, uttt.SYMMETRIES[s][b] * 9 + uttt.SYMMETRIES[s][k]))
+			print("%d/%d: %s %s" % (i + 1, len(found), move, score))
+	records.sort()
+	with open(path + ".tmp", "wb") as f:
+		f.write(uttt.BOOK_HEADER.pack(uttt.BOOK_MAGIC, depth, len(records)))
+		for record in records:
+			f.write(uttt.BOOK_RECORD.pack(*record))
+	os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+	import optparse
+	parser = optparse.OptionParser("uttt_book.py [Options]")
+	parser.add_option("-d", "--depth", dest="depth", type="int", default=2,
+	                  help="number of moves covered by the book")
+	parser.add_option("-s", "--strategy", dest="strategy", choices=list(uttt.STRATEGIES),
+	                  default="alphabeta", help="strategy: " + ", ".join(uttt.STRATEGIES))
+	parser.add_option("-t", "--timeout", dest="timeout", type="float", default=1.0,
+	                  help="time per position")
+	parser.add_option("-w", "--workers", dest="workers", type="int", default=os.cpu_count(),
+	                  help="worker processes")
+	parser.add_option("-o", "--output", dest="path", default=uttt.BOOK_FILE, help="book file")
+	(options, args) = parser.parse_args()
+
+	create_book(options.depth, options.strategy, options.timeout, options.workers, options.path)
@@ -13,31 +13,89 @@ TODO
 - code-cleanup, documentation
 - handle draw and winning-draw
 - key-bindings (q,n,e,p?)
-- start parameters?
 """
 
 import tkinter
 import tkinter.font
+import concurrent.futures
 import uttt
 
 SIDE = 36
 FONT_FAMILY = "Arial"
 FONT_VALUE  = None
 FONT_MARKER = None
-TIMEOUT = 0.1
+TIMEOUT = 0.1 # length of each analysis slice; scores are updated after each
+POLL = 20     # interval for polling analysis results, in ms
+
+def init_worker(timeout):
+	uttt.TIMEOUT = timeout
+
+class Engine:
+	"""Runs evaluations in a background process, so the UI does not freeze.
+	Results are polled via after() and passed to the callback, unless the
+	evaluation has been cancelled in the meantime, i.e. if it belongs to an
+	older generation.
+	"""
+
+	def __init__(self, widget):
+		self.widget = widget
+		self.pool = self.create_pool()
+		self.future = None
+		self.generation = 0
+	
+	def create_pool(self):
+		return concurrent.futures.ProcessPoolExecutor(1, initializer=init_worker,
+		                                              initargs=(uttt.TIMEOUT,))
+	
+	def submit(self, callback, function, *args):
+		self.future = self.pool.submit(function, *args)
+		self.widget.after(POLL, self.poll, self.future, self.generation, callback)
+	
+	def poll(self, future, generation, callback):
+		if generation == self.generation:
+			if future.done():
+				self.future = None
+				callback(future.result())
+			else:
+				self.widget.after(POLL, self.poll, future, generation, callback)
+	
+	def cancel(self):
+		"""Cancel current evaluation; if it is already running, the worker
+		is left to finish it and a new one is started for the next request.
+		"""
+		self.generation += 1
+		if self.future is not None and not self.future.cancel() and not self.future.done():
+			self.pool.shutdown(wait=False, cancel_futures=True)
+			self.pool = self.create_pool()
+		self.future = None
+	
+	def shutdown(self):
+		self.generation += 1
+		self.future = None
+		self.pool.shutdown(wait=False, cancel_futures=True)
+	
+	def busy(self):
+		return self.future is not None
 
 class UTTTFrame(tkinter.Frame):
 	"""Tkinter-Frame for displaying and playing a game of Ultimate Tic Tac Toe.
 	"""
 
-	def __init__(self, master=None):
+	def __init__(self, master=None, strategy=None):
 		tkinter.Frame.__init__(self, master)
+		self.strategy = strategy
 		self.master.title("Ultimate Tic Tac Toe")
 		self.grid()
 				
+		self.engine = Engine(self)
+		self.master.protocol("WM_DELETE_WINDOW", self.quit_game)
+		self.analysing = False
+		self.play_when_ready = False
+		
 		# create buttons panel
 		tkinter.Button(self, text="New Game", command=self.new_game).grid(row=0, column=0)
-		tkinter.Button(self, text="Evaluate", command=self.eval_moves).grid(row=0, column=1)
+		self.eval_var = tkinter.StringVar(value="Evaluate")
+		tkinter.Button(self, textvariable=self.eval_var, command=self.eval_moves).grid(row=0, column=1)
 		tkinter.Button(self, text="Play Best", command=self.play_best).grid(row=0, column=2)
 		self.status_var = tkinter.StringVar()
 		tkinter.Label(self, textvariable=self.status_var).grid(row=1, column=0, columnspan=3)
@@ -49,6 +107,7 @@ class UTTTFrame(tkinter.Frame):
 		self.new_game()
 	
 	def new_game(self):
+		self.stop_analysis()
 		self.board = uttt.init_board()
 		self.player = +1
 		self.last_move = (-1, -1)
@@ -56,18 +115,58 @@ class UTTTFrame(tkinter.Frame):
 		self.game_over = False
 		self.update()
 	
+	def quit_game(self):
+		self.engine.shutdown()
+		self.master.destroy()
+	
 	def eval_moves(self):
-		if not self.game_over:
-			moves = uttt.get_moves(self.board, self.last_move)
-			scores = uttt.evaluate_moves(self.board, moves, self.player, TIMEOUT)
-			for k in scores:
-				self.scores[k] = self.scores.get(k, 0) + scores[k]
+		"""Start continuous analysis in the background, or stop it if running.
+		"""
+		if self.analysing:
+			self.stop_analysis()
 			self.update()
-		
+		elif not self.game_over:
+			self.analysing = True
+			self.eval_var.set("Stop")
+			self.analyse()
+	
+	def analyse(self):
+		moves = uttt.get_moves(self.board, self.last_move)
+		self.engine.submit(self.analysed, uttt.evaluate_moves, self.board, moves, self.player, TIMEOUT)
+	
+	def analysed(self, scores):
+		"""Merge scores of one analysis slice and recolor the board.
+		"""
+		for k in scores:
+			self.scores[k] = self.scores.get(k, 0) + scores[k]
+		if self.play_when_ready:
+			self.stop_analysis()
+			self.play_best()
+		else:
+			self.update()
+			self.analyse()
+	
+	def stop_analysis(self):
+		self.engine.cancel()
+		self.analysing = False
+		self.play_when_ready = False
+		self.eval_var.set("Evaluate")
+	
 	def play_best(self):
-		if not self.game_over:
+		if not self.game_over and not self.play_when_ready:
+			if self.strategy:
+				moves = uttt.get_moves(self.board, self.last_move)
+				self.stop_analysis()
+				self.play_when_ready = True
+				self.engine.submit(lambda result: self.apply_move(result[1]), uttt.best_move,
+				                   self.board, moves, self.player, self.strategy)
+				self.update()
+				return
 			if not self.scores:
-				self.eval_moves()
+				if not self.analysing:
+					self.eval_moves()
+				self.play_when_ready = True
+				return
 			moves = uttt.get_moves(self.board, self.last_move)
 			win_move = uttt.winning_move(self.board, moves, self.player)
 			non_lose = uttt.non_losing_moves(self.board, moves, self.player)
@@ -83,6 +182,7 @@ class UTTTFrame(tkinter.Frame):
 				self.apply_move(move)
 	
 	def apply_move(self, move):
+		self.stop_analysis()
 		self.board = uttt.apply_move(self.board, move, self.player)
 		self.last_move = move
 		self.player = -self.player
@@ -110,7 +210,8 @@ class UTTTFrame(tkinter.Frame):
 			self.status_var.set("%s has won!" % uttt.SYMBOL[-self.player])
 			self.game_over = True
 		else:
-			self.status_var.set("Next: %s's turn" % uttt.SYMBOL[self.player])
+			self.status_var.set("Next: %s's turn%s" % (uttt.SYMBOL[self.player],
+					" (thinking...)" if self.engine.busy() else ""))
 		self.canvas.delete("all")
 		valid = uttt.get_moves(self.board, self.last_move)
 		for i, board in enumerate(self.board):
@@ -140,7 +241,12 @@ class UTTTFrame(tkinter.Frame):
 # start application
 if __name__ == "__main__":
 	import optparse
-	parser = optparse.OptionParser("uttt_game.py")
+	parser = optparse.OptionParser("uttt_game.py [Options]")
+	parser.add_option("-s", "--strategy", dest="strategy", choices=list(uttt.STRATEGIES),
+	                  help="strategy for 'Play Best': %s; default: accumulated scores"
+	                  % ", ".join(uttt.STRATEGIES))
+	parser.add_option("-t", "--timeout", dest="timeout", type="float", default=uttt.TIMEOUT,
+	                  help="thinking time for 'Play Best' with strategy; default: %.1f" % uttt.TIMEOUT)
 	(options, args) = parser.parse_args()
 
 	#~try:
@@ -154,5 +260,6 @@ if __name__ == "__main__":
 	FONT_LARGE = tkinter.font.Font(family=FONT_FAMILY, size=9*SIDE//4)
 	FONT_SMALL = tkinter.font.Font(family=FONT_FAMILY, size=3*SIDE//4)
 		
-	app = UTTTFrame(root)
+	uttt.TIMEOUT = options.timeout
+	app = UTTTFrame(root, uttt.STRATEGIES.get(options.strategy))
 	app.mainloop()
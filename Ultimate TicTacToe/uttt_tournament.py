@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""Ultimate Tic Tac Toe Tournament
+
+Headless self-play between two strategies from uttt.STRATEGIES. Games are
+played in parallel worker processes, alternating which strategy moves first,
+without any board output. Reports wins, draws and losses with confidence
+intervals, as well as time per move and random plays per second.
+"""
+
+import collections, concurrent.futures, math, os, random, time
+import uttt
+
+Z = 1.96 # for 95% confidence intervals
+
+
+def quiet():
+	""" initialize worker process: suppress all debug output
+	"""
+	uttt.debug = lambda *args, **kwargs: None
+
+def timed(strategy, stats):
+	""" wrap strategy so that calls, time and random plays are counted in stats
+	"""
+	def wrapped(board, moves, player):
+		plays = uttt.COUNTERS["plays"]
+		start = time.time()
+		result = strategy(board, moves, player)
+		stats["time"] += time.time() - start
+		stats["calls"] += 1
+		stats["plays"] += uttt.COUNTERS["plays"] - plays
+		return result
+	return wrapped
+
+def play(names, first, seed, timeout):
+	""" play one game in worker process, with first strategy as OWN and second
+	as OPP; return winner, stats of both strategies, and table hits and misses
+	"""
+	uttt.TIMEOUT = timeout
+	uttt.TT = uttt.TranspositionTable()
+	uttt.MCTS_TREES.clear()
+	random.seed(seed)
+	stats = {p: collections.Counter() for p in (uttt.OWN, uttt.OPP)}
+	strategies = {p: timed(uttt.STRATEGIES[name], stats[p])
+	              for p, name in zip((uttt.OWN, uttt.OPP), names)}
+	winner = uttt.play_game(strategies, first, verbose=False)
+	return winner, stats[uttt.OWN], stats[uttt.OPP], (uttt.TT.hits, uttt.TT.misses)
+
+def run_tournament(names, games, workers=None, timeout=uttt.TIMEOUT, seed=None):
+	""" play games between the two strategies, return results as counters of
+	wins (+1), draws (0) and losses (-1) of the first strategy, by who moved
+	first, and stats for both strategies
+	"""
+	master = random.Random(seed)
+	results = {uttt.OWN: collections.Counter(), uttt.OPP: collections.Counter()}
+	stats = [collections.Counter(), collections.Counter()]
+	with concurrent.futures.ProcessPoolExecutor(workers, initializer=quiet) as pool:
+		futures = {pool.submit(play, names, first, master.getrandbits(32), timeout): first
+		           for first in (uttt.OWN if i % 2 == 0 else uttt.OPP for i in range(games))}
+		for i, future in enumerate(concurrent.futures.as_completed(futures)):
+			winner, stats_a, stats_b, (hits, misses) = future.result()
+			results[futures[future]][winner] += 1
+			stats[0].update(stats_a)
+			stats[1].update(stats_b)
+			stats[0].update(hits=hits, misses=misses)
+			print("game %d/%d: %s" % (i + 1, games, {+1: names[0], -1: names[1], 0: "draw"}[winner]))
+	return results, stats
+
+def interval(k, n):
+	""" Wilson score interval for k successes in n trials
+	"""
+	if n == 0:
+		return 0.0, 0.0
+	p = k / n
+	d = 1 + Z**2 / n
+	c = (p + Z**2 / (2 * n)) / d
+	h = Z * math.sqrt(p * (1 - p) / n + Z**2 / (4 * n**2)) / d
+	return c - h, c + h
+
+def report(names, results, stats):
+	""" print summary of tournament results and performance
+	"""
+	total = results[uttt.OWN] + results[uttt.OPP]
+	n = sum(total.values())
+	print("%s vs. %s, %d games" % (names[0], names[1], n))
+	for label, r in (("win", +1), ("draw", 0), ("loss", -1)):
+		lo, hi = interval(total[r], n)
+		print("  %-5s %4d  %5.1f%%  [%5.1f%%, %5.1f%%]" % (label, total[r], 100 * total[r] / max(1, n), 100 * lo, 100 * hi))
+	# results are from the first strategy's point of view, flip for the second
+	for first, name, s in ((uttt.OWN, names[0], +1), (uttt.OPP, names[1], -1)):
+		r = results[first]
+		print("  %s moving first: %d/%d/%d W/D/L" % (name, r[+s], r[0], r[-s]))
+	score = (total[+1] + total[0] / 2) / max(1, n)
+	var = (total[+1] + total[0] / 4) / max(1, n) - score**2
+	print("  score %.3f +/- %.3f" % (score, Z * math.sqrt(max(0, var) / max(1, n))))
+	for name, s in zip(names, stats):
+		print("  %s: %.3f s per move, %.0f random plays per second" % (name,
+				s["time"] / max(1, s["calls"]), s["plays"] / max(1e-9, s["time"])))
+	hits, misses = stats[0]["hits"], stats[0]["misses"]
+	print("  transposition table hit rate %.3f" % (hits / max(1, hits + misses)))
+
+
+if __name__ == "__main__":
+	import optparse
+	parser = optparse.OptionParser("uttt_tournament.py [Options] STRATEGY STRATEGY\n"
+	                               "strategies: " + ", ".join(uttt.STRATEGIES))
+	parser.add_option("-n", "--games", dest="games", type="int", default=100, help="number of games")
+	parser.add_option("-w", "--workers", dest="workers", type="int", default=os.cpu_count(), help="worker processes")
+	parser.add_option("-t", "--timeout", dest="timeout", type="float", default=uttt.TIMEOUT, help="time per move")
+	parser.add_option("-s", "--seed", dest="seed", type="int", default=None, help="master random seed")
+	(options, args) = parser.parse_args()
+
+	if len(args) != 2 or any(a not in uttt.STRATEGIES for a in args):
+		parser.error("Give two strategies, out of: " + ", ".join(uttt.STRATEGIES))
+	results, stats = run_tournament(args, options.games, options.workers, options.timeout, options.seed)
+	report(args, results, stats)